@@ -4,9 +4,29 @@ from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
 from sklearn.preprocessing import LabelEncoder
 import joblib
 import os
+import copy
 from datetime import datetime, timedelta
+from .config import settings
+from .event_features import event_stats
+
+
+def _with_n_jobs(model, n_jobs):
+    # A shallow copy shares the fitted trees; only this call predicts in parallel.
+    model = copy.copy(model)
+    model.n_jobs = n_jobs
+    return model
+
 
 class BehaviorAnalyzer:
+    # Model input columns, in order; the last is the encoded content type.
+    FEATURE_NAMES = [
+        'total_events', 'unique_content', 'page_views', 'clicks', 'scrolls',
+        'pauses', 'resumes', 'completes', 'tab_switches', 'video_watches',
+        'quiz_attempts', 'avg_time_between_events', 'session_duration',
+        'interaction_density', 'raw_engagement_score', 'friction_score',
+        'dominant_content_type'
+    ]
+
     def __init__(self):
         self.engagement_model = None
         self.dropout_model = None
@@ -14,16 +34,17 @@ class BehaviorAnalyzer:
         self.difficulty_encoder = LabelEncoder()
         self.is_trained = False
         
-    def _extract_features(self, events_df):
-        if events_df.empty:
+    def _extract_features(self, events):
+        if events is None or len(events) == 0:
             return None
+        stats = event_stats(events)
             
         features = {}
         
-        features['total_events'] = len(events_df)
-        features['unique_content'] = events_df['content_id'].nunique() if 'content_id' in events_df.columns else 0
+        features['total_events'] = stats.count
+        features['unique_content'] = len(stats.content_ids)
         
-        event_types = events_df['event_type'].value_counts() if 'event_type' in events_df.columns else pd.Series()
+        event_types = stats.event_types
         features['page_views'] = event_types.get('page_view', 0)
         features['clicks'] = event_types.get('click', 0)
         features['scrolls'] = event_types.get('scroll', 0)
@@ -34,14 +55,10 @@ class BehaviorAnalyzer:
         features['video_watches'] = event_types.get('video_play', 0)
         features['quiz_attempts'] = event_types.get('quiz_answer', 0)
         
-        if 'timestamp' in events_df.columns:
-            if len(events_df) > 1:
-                time_diffs = events_df['timestamp'].diff().dt.total_seconds().dropna()
-                features['avg_time_between_events'] = time_diffs.mean() if len(time_diffs) > 0 else 0
-                features['session_duration'] = (events_df['timestamp'].max() - events_df['timestamp'].min()).total_seconds()
-            else:
-                features['avg_time_between_events'] = 0
-                features['session_duration'] = 0
+        if 'timestamp' in stats.fields and stats.count > 1:
+            # Differences in the order the events were sent, as before.
+            features['avg_time_between_events'] = stats.mean_arrival_gap_seconds
+            features['session_duration'] = stats.duration_seconds
         else:
             features['avg_time_between_events'] = 0
             features['session_duration'] = 0
@@ -53,11 +70,7 @@ class BehaviorAnalyzer:
         features['raw_engagement_score'] = (engagement_signals * 10) / max(features['total_events'], 1)
         features['friction_score'] = friction_signals / max(features['total_events'], 1)
         
-        if 'content_type' in events_df.columns:
-            dominant = events_df['content_type'].mode()
-            features['dominant_content_type'] = dominant.iloc[0] if len(dominant) > 0 else 'video'
-        else:
-            features['dominant_content_type'] = 'video'
+        features['dominant_content_type'] = stats.content_type_mode('video')
             
         return features
     
@@ -67,25 +80,7 @@ class BehaviorAnalyzer:
             
         content_type = self.content_type_encoder.transform([features['dominant_content_type']])[0] if features['dominant_content_type'] in self.content_type_encoder.classes_ else 0
         
-        return np.array([
-            features['total_events'],
-            features['unique_content'],
-            features['page_views'],
-            features['clicks'],
-            features['scrolls'],
-            features['pauses'],
-            features['resumes'],
-            features['completes'],
-            features['tab_switches'],
-            features['video_watches'],
-            features['quiz_attempts'],
-            features['avg_time_between_events'],
-            features['session_duration'],
-            features['interaction_density'],
-            features['raw_engagement_score'],
-            features['friction_score'],
-            content_type
-        ])
+        return np.array([features[name] for name in self.FEATURE_NAMES[:-1]] + [content_type])
     
     def train(self, training_data_path=None):
         np.random.seed(42)
@@ -128,7 +123,12 @@ class BehaviorAnalyzer:
         
         df['engagement_score'] = engagement_scores
         df['dropout_probability'] = dropout_probs
-        
+
+        # Same derivation as _extract_features.
+        events = df['total_events'].clip(lower=1)
+        df['raw_engagement_score'] = (df['completes'] + df['video_watches'] * 0.5) * 10 / events
+        df['friction_score'] = (df['tab_switches'] + df['pauses'] * 0.3) / events
+
         self.content_type_encoder.fit(['video', 'quiz', 'text', 'interactive', 'simulation'])
         
         X = []
@@ -150,16 +150,29 @@ class BehaviorAnalyzer:
         self.is_trained = True
         return self
     
-    def predict_engagement(self, events_df):
+    def extract_once(self, events):
+        """
+        (features, X) for a learner's events (event dicts, a DataFrame, a
+        structured array or an EventStats), where X is the (1, n) model
+        input row.  Compute it once and pass it as `extracted` to
+        predict_engagement / predict_dropout / get_recommendation so both
+        models share one feature pass.  (None, None) when there are no events.
+        """
         if not self.is_trained:
             self.train()
-        
-        features = self._extract_features(events_df)
+        features = self._extract_features(events)
+        if features is None:
+            return None, None
+        return features, self._features_to_vector(features).reshape(1, -1)
+    
+    def predict_engagement(self, events, extracted=None):
+        features, X = extracted if extracted is not None else self.extract_once(events)
         if features is None:
             return {'engagement_score': 50, 'confidence': 0}
         
-        X = self._features_to_vector(features).reshape(1, -1)
-        score = self.engagement_model.predict(X)[0]
+        return self._engagement_result(features, self.engagement_model.predict(X)[0])
+    
+    def _engagement_result(self, features, score):
         score = max(0, min(100, score))
         
         return {
@@ -172,17 +185,14 @@ class BehaviorAnalyzer:
             }
         }
     
-    def predict_dropout(self, events_df):
-        if not self.is_trained:
-            self.train()
-        
-        features = self._extract_features(events_df)
+    def predict_dropout(self, events, extracted=None):
+        features, X = extracted if extracted is not None else self.extract_once(events)
         if features is None:
             return {'dropout_probability': 0.5, 'risk_level': 'medium'}
         
-        X = self._features_to_vector(features).reshape(1, -1)
-        prob = self.dropout_model.predict_proba(X)[0]
-        
+        return self._dropout_result(features, self.dropout_model.predict_proba(X)[0])
+    
+    def _dropout_result(self, features, prob):
         dropout_prob = prob[1] if len(prob) > 1 else prob[0]
         
         risk_level = 'low'
@@ -201,10 +211,13 @@ class BehaviorAnalyzer:
             }
         }
     
-    def get_recommendation(self, events_df):
-        engagement = self.predict_engagement(events_df)
-        dropout = self.predict_dropout(events_df)
-        
+    def get_recommendation(self, events, extracted=None):
+        extracted = extracted if extracted is not None else self.extract_once(events)
+        engagement = self.predict_engagement(events, extracted)
+        dropout = self.predict_dropout(events, extracted)
+        return self._recommend(engagement, dropout)
+    
+    def _recommend(self, engagement, dropout):
         recommendation = {
             'action': 'continue',
             'content_type': 'video',
@@ -230,6 +243,47 @@ class BehaviorAnalyzer:
             'dropout': dropout
         }
     
+    def score_batch(self, learners, n_jobs=None):
+        """
+        get_recommendation() for many learners with a single feature matrix
+        and one predict / predict_proba call per model, run on `n_jobs`
+        threads (BEHAVIOR_BATCH_N_JOBS by default).  Each learner is a dict
+        with a user_id and either `events` or `features`, a precomputed
+        model input row (X from extract_once).  Returns one result per
+        learner, in input order, each with the learner's user_id.
+        """
+        if not self.is_trained:
+            self.train()
+        n_jobs = settings.BEHAVIOR_BATCH_N_JOBS if n_jobs is None else n_jobs
+        
+        results = []
+        scored = []
+        rows = []
+        for learner in learners:
+            user_id = learner.get('user_id')
+            if learner.get('features') is not None:
+                row = np.asarray(learner['features'], dtype=np.float64).ravel()
+                if len(row) != len(self.FEATURE_NAMES):
+                    raise ValueError(f"features for user {user_id} must have {len(self.FEATURE_NAMES)} values, got {len(row)}")
+                features = dict(zip(self.FEATURE_NAMES, row.tolist()))
+            else:
+                features = self._extract_features(learner.get('events') or [])
+                if features is None:
+                    results.append({'user_id': user_id, **self.get_recommendation(None, (None, None))})
+                    continue
+                row = self._features_to_vector(features)
+            scored.append((len(results), features))
+            results.append({'user_id': user_id})
+            rows.append(row)
+        
+        if rows:
+            X = np.vstack(rows)
+            scores = _with_n_jobs(self.engagement_model, n_jobs).predict(X)
+            probs = _with_n_jobs(self.dropout_model, n_jobs).predict_proba(X)
+            for (i, features), score, prob in zip(scored, scores, probs):
+                results[i].update(self._recommend(self._engagement_result(features, score), self._dropout_result(features, prob)))
+        return results
+    
     def save(self, path='models/behavior_model.joblib'):
         joblib.dump({
             'engagement_model': self.engagement_model,
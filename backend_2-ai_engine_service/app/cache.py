@@ -0,0 +1,148 @@
+import threading
+import time
+from collections import OrderedDict
+import redis
+from .config import settings
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Thread-safe LRU cache with optional per-entry TTL and hit/miss counters."""
+
+    def __init__(self, maxsize, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING:
+                value, expires_at = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+class RedisTier:
+    """
+    Shared second cache tier so all uvicorn workers see each other's entries.
+    Values are raw bytes.  Redis errors never fail a request: the tier is
+    skipped for RETRY_AFTER seconds and the caller falls back to computing.
+    """
+
+    RETRY_AFTER = 30.0
+
+    def __init__(self, prefix, ttl=None, url=None):
+        self.prefix = prefix
+        self.ttl = ttl
+        self.url = url or settings.REDIS_URL
+        self._client = None
+        self._disabled_until = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def _redis(self):
+        if time.monotonic() < self._disabled_until:
+            return None
+        if self._client is None:
+            self._client = redis.from_url(self.url, socket_timeout=0.2, socket_connect_timeout=0.2)
+        return self._client
+
+    @property
+    def available(self):
+        """False while the tier is skipped after an error."""
+        return time.monotonic() >= self._disabled_until
+
+    def _failed(self, e):
+        self.errors += 1
+        self._disabled_until = time.monotonic() + self.RETRY_AFTER
+        print(f"Warning: redis cache tier {self.prefix} unavailable: {e}")
+
+    def get_many(self, keys):
+        """Dict of key -> bytes for the keys present in Redis."""
+        client = self._redis()
+        if client is None or not keys:
+            return {}
+        try:
+            values = client.mget([self.prefix + k for k in keys])
+        except redis.RedisError as e:
+            self._failed(e)
+            return {}
+        found = {k: v for k, v in zip(keys, values) if v is not None}
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def get(self, key):
+        return self.get_many([key]).get(key)
+
+    def set_many(self, items):
+        client = self._redis()
+        if client is None or not items:
+            return
+        try:
+            pipe = client.pipeline(transaction=False)
+            for key, value in items.items():
+                pipe.set(self.prefix + key, value, ex=int(self.ttl) if self.ttl else None)
+            pipe.execute()
+        except redis.RedisError as e:
+            self._failed(e)
+
+    def set(self, key, value):
+        self.set_many({key: value})
+
+    def delete(self, key):
+        client = self._redis()
+        if client is None:
+            return
+        try:
+            client.delete(self.prefix + key)
+        except redis.RedisError as e:
+            self._failed(e)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'errors': self.errors}
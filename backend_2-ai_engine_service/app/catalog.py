@@ -1,14 +1,21 @@
+import hashlib
+import os
+import shutil
+import threading
+import time
 import pandas as pd
 from typing import Optional
 from .config import settings
+from .columnar import save_columns, load_columns, read_manifest, to_frame
+from .search_index import SearchIndex
+from .filters import AttributeBitmaps
 
 REQUIRED_COLUMNS = [
     "course_id", "title", "description", "nsqf_level",
     "skills", "keywords", "duration_months", "language", "region"
 ]
 
-def load_catalog(path: Optional[str] = None) -> pd.DataFrame:
-    path = path or settings.NSQF_COURSES_PATH
+def read_catalog_csv(path: str) -> pd.DataFrame:
     df = pd.read_csv(path)
     for c in REQUIRED_COLUMNS:
         if c not in df.columns:
@@ -19,3 +26,164 @@ def load_catalog(path: Optional[str] = None) -> pd.DataFrame:
     df['description'] = df['description'].fillna("").astype(str)
     df['title'] = df['title'].fillna("").astype(str)
     return df
+
+
+class Catalog:
+    """
+    One loaded version of the course catalog: the normalized columns plus a
+    course_id -> row hash index.  Treat as read-only; to_frame() hands out
+    copies for callers that filter or mutate.
+    """
+
+    def __init__(self, frame, signature=None):
+        self.frame = frame
+        self.signature = signature
+        self._lock = threading.Lock()
+        self._search_index = None
+        self._bitmaps = None
+        self.course_ids = frame['course_id'].tolist()
+        self._row_of_id = {}
+        for row, course_id in enumerate(self.course_ids):
+            # First row wins, like df[df['course_id'] == id].iloc[0].
+            self._row_of_id.setdefault(course_id, row)
+
+    def __len__(self):
+        return len(self.course_ids)
+
+    def to_frame(self) -> pd.DataFrame:
+        return self.frame.copy()
+
+    @property
+    def search_index(self) -> SearchIndex:
+        """BM25F keyword index, built on first use for this catalog version."""
+        if self._search_index is None:
+            with self._lock:
+                if self._search_index is None:
+                    self._search_index = SearchIndex(self.frame.to_dict(orient='records'))
+        return self._search_index
+
+    @property
+    def bitmaps(self) -> AttributeBitmaps:
+        """Filter bitmaps over catalog rows (same semantics as apply_filters)."""
+        if self._bitmaps is None:
+            with self._lock:
+                if self._bitmaps is None:
+                    self._bitmaps = AttributeBitmaps(self.frame.to_dict(orient='records'))
+        return self._bitmaps
+
+    def records(self, rows):
+        """Course dicts for catalog row positions, in the given order."""
+        return self.frame.iloc[list(rows)].to_dict(orient='records')
+
+    def row_of(self, course_id):
+        return self._row_of_id.get(str(course_id))
+
+    def get(self, course_id):
+        """Course record for `course_id`, or None."""
+        row = self.row_of(course_id)
+        return None if row is None else self.frame.iloc[row].to_dict()
+
+
+class CatalogStore:
+    """
+    Process-wide catalog cache.  The CSV is parsed once per change and kept
+    in memory; each parse is also saved as .npy columns under
+    CATALOG_SNAPSHOT_DIR so other workers (and restarts) load the columns
+    instead of re-parsing the CSV.  The source mtime/size is re-checked at
+    most every CATALOG_RELOAD_CHECK_SECONDS and a change triggers a reload.
+    """
+
+    def __init__(self, path=None, snapshot_dir=None):
+        self.path = path or settings.NSQF_COURSES_PATH
+        self.snapshot_dir = snapshot_dir or settings.CATALOG_SNAPSHOT_DIR
+        self._lock = threading.Lock()
+        self._current = None
+        self._checked_at = 0.0
+        self.loads = 0
+        self.snapshot_loads = 0
+
+    def _signature(self):
+        st = os.stat(self.path)
+        return (st.st_mtime_ns, st.st_size)
+
+    def _snapshot_path(self, signature):
+        key = f"{os.path.abspath(self.path)}\x00{signature[0]}\x00{signature[1]}"
+        return os.path.join(self.snapshot_dir, hashlib.sha1(key.encode("utf-8")).hexdigest()[:16])
+
+    def get(self) -> Catalog:
+        current = self._current
+        if current is not None and time.monotonic() - self._checked_at < settings.CATALOG_RELOAD_CHECK_SECONDS:
+            return current
+
+        with self._lock:
+            try:
+                signature = self._signature()
+            except FileNotFoundError:
+                if self._current is None:
+                    raise
+                print(f"Warning: catalog {self.path} is missing, serving the loaded copy")
+                return self._current
+            self._checked_at = time.monotonic()
+            if self._current is None or self._current.signature != signature:
+                self._current = self._load(signature)
+                self.loads += 1
+            return self._current
+
+    def _load(self, signature):
+        directory = self._snapshot_path(signature)
+        if os.path.isdir(directory):
+            try:
+                manifest, columns = load_columns(directory)
+                self.snapshot_loads += 1
+                return Catalog(to_frame(directory, manifest, columns), signature)
+            except Exception as e:
+                print(f"Warning: ignoring unreadable catalog snapshot {directory}: {e}")
+
+        frame = read_catalog_csv(self.path)
+        try:
+            save_columns(directory, frame, extra={"source": os.path.abspath(self.path), "signature": list(signature)})
+            self._prune(keep=directory)
+        except OSError as e:
+            # Another worker may have written the same snapshot first.
+            if not os.path.isdir(directory):
+                print(f"Warning: failed to write catalog snapshot {directory}: {e}")
+        return Catalog(frame, signature)
+
+    def _prune(self, keep):
+        source = os.path.abspath(self.path)
+        for name in os.listdir(self.snapshot_dir):
+            directory = os.path.join(self.snapshot_dir, name)
+            if directory == keep or name.startswith(".") or not os.path.isdir(directory):
+                continue
+            try:
+                if read_manifest(directory).get("source") == source:
+                    shutil.rmtree(directory, ignore_errors=True)
+            except (OSError, ValueError):
+                continue
+
+    def stats(self):
+        current = self._current
+        return {
+            "loaded": current is not None,
+            "courses": len(current) if current is not None else 0,
+            "loads": self.loads,
+            "snapshot_loads": self.snapshot_loads,
+        }
+
+
+catalog_store = CatalogStore()
+
+
+def get_catalog() -> Catalog:
+    return catalog_store.get()
+
+
+def load_catalog(path: Optional[str] = None) -> pd.DataFrame:
+    """
+    Normalized catalog DataFrame.  The configured catalog is served from the
+    in-memory store (a copy, so callers may modify it); an explicit `path`
+    is always read fresh from disk.
+    """
+    if path is None:
+        return get_catalog().to_frame()
+    return read_catalog_csv(path)
@@ -0,0 +1,191 @@
+import json
+import os
+import shutil
+import uuid
+from collections.abc import Sequence
+import numpy as np
+import pandas as pd
+
+MANIFEST_FILE = "columns.json"
+ITER_BLOCK_ROWS = 4096
+
+
+def _file_name(i, suffix):
+    return f"col{i:03d}{suffix}.npy"
+
+
+class TextColumn:
+    """
+    A string column stored as one UTF-8 byte blob plus int64 offsets
+    (row i is blob[offsets[i]:offsets[i + 1]]).  Values are decoded on
+    access; indexing with a slice returns a list of str.
+    """
+
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, pos):
+        if isinstance(pos, slice):
+            start, stop, step = pos.indices(len(self))
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            if start >= stop:
+                return []
+            bounds = self.offsets[start:stop + 1].tolist()
+            data = self.blob[bounds[0]:bounds[-1]].tobytes()
+            base = bounds[0]
+            return [data[a - base:b - base].decode("utf-8") for a, b in zip(bounds, bounds[1:])]
+        pos = int(pos)
+        if pos < 0:
+            pos += len(self)
+        if not 0 <= pos < len(self):
+            raise IndexError("row index out of range")
+        a, b = self.offsets[pos:pos + 2].tolist()
+        return self.blob[a:b].tobytes().decode("utf-8")
+
+
+def _save_text(staging, entry, i, values):
+    encoded = [v.encode("utf-8") for v in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(v) for v in encoded], out=offsets[1:])
+    entry["offsets"] = _file_name(i, ".offsets")
+    np.save(os.path.join(staging, entry["file"]), np.frombuffer(b"".join(encoded), dtype=np.uint8), allow_pickle=False)
+    np.save(os.path.join(staging, entry["offsets"]), offsets, allow_pickle=False)
+
+
+def _block(values, start, stop):
+    # Rows start:stop as a list, for TextColumns and (older) fixed-width arrays alike.
+    block = values[start:stop]
+    return block if isinstance(block, list) else block.tolist()
+
+
+def save_columns(directory, frame: pd.DataFrame, extra=None):
+    """
+    Write each DataFrame column as its own .npy file so readers can
+    np.load(..., mmap_mode='r') them without pickle.  Object (string)
+    columns are stored as a UTF-8 blob plus offsets (see TextColumn) and a
+    null mask.  The directory is written under a temporary name and
+    renamed into place.
+    """
+    parent = os.path.dirname(os.path.abspath(directory))
+    os.makedirs(parent, exist_ok=True)
+    staging = os.path.join(parent, f".{os.path.basename(directory)}.{uuid.uuid4().hex}.tmp")
+    os.makedirs(staging)
+    try:
+        columns = []
+        for i, name in enumerate(frame.columns):
+            series = frame[name]
+            entry = {"name": str(name), "file": _file_name(i, "")}
+            if series.dtype == object:
+                nulls = series.isna().to_numpy()
+                entry["kind"] = "utf8"
+                _save_text(staging, entry, i, series.where(~nulls, "").astype(str).tolist())
+                if nulls.any():
+                    entry["nulls"] = _file_name(i, ".null")
+                    np.save(os.path.join(staging, entry["nulls"]), nulls)
+            else:
+                entry["kind"] = "numeric"
+                np.save(os.path.join(staging, entry["file"]), series.to_numpy(), allow_pickle=False)
+            columns.append(entry)
+        manifest = dict(extra or {}, rows=len(frame), columns=columns)
+        with open(os.path.join(staging, MANIFEST_FILE), "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.rename(staging, directory)
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    return manifest
+
+
+def read_manifest(directory):
+    with open(os.path.join(directory, MANIFEST_FILE)) as f:
+        return json.load(f)
+
+
+def load_columns(directory, mmap=True):
+    """
+    (manifest, {name: array}) for a directory written by save_columns.
+    Arrays are read-only memory maps when `mmap` is true; string columns
+    are TextColumns over them (fixed-width unicode arrays in directories
+    written before those), see to_frame for null handling.
+    """
+    manifest = read_manifest(directory)
+    mode = "r" if mmap else None
+    columns = {}
+    for entry in manifest["columns"]:
+        values = np.load(os.path.join(directory, entry["file"]), mmap_mode=mode, allow_pickle=False)
+        if entry["kind"] == "utf8":
+            values = TextColumn(values, np.load(os.path.join(directory, entry["offsets"]), mmap_mode=mode, allow_pickle=False))
+        columns[entry["name"]] = values
+    return manifest, columns
+
+
+def to_frame(directory, manifest, columns):
+    """Rebuild the DataFrame save_columns was given, including NaNs in string columns."""
+    data = {}
+    for entry in manifest["columns"]:
+        values = columns[entry["name"]]
+        if entry["kind"] != "numeric":
+            values = np.array(_block(values, 0, len(values)), dtype=object)
+            if "nulls" in entry:
+                values[np.load(os.path.join(directory, entry["nulls"]))] = np.nan
+        else:
+            values = np.array(values)
+        data[entry["name"]] = values
+    return pd.DataFrame(data, columns=[e["name"] for e in manifest["columns"]])
+
+
+class ColumnarMeta(Sequence):
+    """
+    Read-only list of row dicts over a save_columns directory, equal to
+    DataFrame.to_dict(orient='records') of the saved frame.  Columns stay
+    memory-mapped, so processes loading the same directory share one copy
+    in the page cache; a row dict is built on access.
+    """
+
+    def __init__(self, directory, mmap=True):
+        manifest, columns = load_columns(directory, mmap=mmap)
+        mode = "r" if mmap else None
+        self.directory = directory
+        self.columns = [e["name"] for e in manifest["columns"]]
+        self._arrays = [columns[e["name"]] for e in manifest["columns"]]
+        self._is_str = [e["kind"] != "numeric" for e in manifest["columns"]]
+        self._nulls = [np.load(os.path.join(directory, e["nulls"]), mmap_mode=mode) if "nulls" in e else None
+                       for e in manifest["columns"]]
+        self._rows = manifest["rows"]
+
+    def __len__(self):
+        return self._rows
+
+    def __getitem__(self, pos):
+        if isinstance(pos, slice):
+            return [self[i] for i in range(*pos.indices(self._rows))]
+        pos = int(pos)
+        if pos < 0:
+            pos += self._rows
+        if not 0 <= pos < self._rows:
+            raise IndexError("row index out of range")
+        row = {}
+        for name, values, is_str, nulls in zip(self.columns, self._arrays, self._is_str, self._nulls):
+            if is_str:
+                row[name] = np.nan if nulls is not None and nulls[pos] else str(values[pos])
+            else:
+                row[name] = values[pos].item()
+        return row
+
+    def __iter__(self):
+        # Whole blocks per column: building the reranker/bitmaps walks every row.
+        for start in range(0, self._rows, ITER_BLOCK_ROWS):
+            stop = min(start + ITER_BLOCK_ROWS, self._rows)
+            blocks = []
+            for values, nulls in zip(self._arrays, self._nulls):
+                block = _block(values, start, stop)
+                if nulls is not None:
+                    block = [np.nan if null else v for v, null in zip(block, nulls[start:stop].tolist())]
+                blocks.append(block)
+            for row in zip(*blocks):
+                yield dict(zip(self.columns, row))
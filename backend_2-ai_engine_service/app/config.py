@@ -8,6 +8,52 @@ class Settings(BaseSettings):
     INDEX_PATH: str = os.getenv("INDEX_PATH", "./models/faiss.index")
     EMBEDS_PATH: str = os.getenv("EMBEDS_PATH", "./models/course_embeds.npy")
     META_PATH: str = os.getenv("META_PATH", "./models/course_meta.pkl")
+    CATALOG_SNAPSHOT_DIR: str = os.getenv("CATALOG_SNAPSHOT_DIR", "./models/catalog")
+    CATALOG_RELOAD_CHECK_SECONDS: float = float(os.getenv("CATALOG_RELOAD_CHECK_SECONDS", "1.0"))
+    INDEX_VERSIONS_DIR: str = os.getenv("INDEX_VERSIONS_DIR", "./models/index_versions")
+    INDEX_VERSION_PATH: str = os.getenv("INDEX_VERSION_PATH", "./models/index.version")
+    INDEX_KEEP_VERSIONS: int = int(os.getenv("INDEX_KEEP_VERSIONS", "3"))
+    INDEX_BUILD_BATCH_SIZE: int = int(os.getenv("INDEX_BUILD_BATCH_SIZE", "256"))
+    INDEX_TYPE: str = os.getenv("INDEX_TYPE", "flat")  # flat | ivf_flat | ivf_pq | hnsw | sq8 | sqfp16 | ivf_sq8
+    INDEX_NLIST: int = int(os.getenv("INDEX_NLIST", "0"))  # 0 = 4 * sqrt(n_courses)
+    INDEX_NPROBE: int = int(os.getenv("INDEX_NPROBE", "16"))
+    INDEX_PQ_M: int = int(os.getenv("INDEX_PQ_M", "16"))
+    INDEX_PQ_NBITS: int = int(os.getenv("INDEX_PQ_NBITS", "8"))
+    INDEX_HNSW_M: int = int(os.getenv("INDEX_HNSW_M", "32"))
+    INDEX_EF_CONSTRUCTION: int = int(os.getenv("INDEX_EF_CONSTRUCTION", "200"))
+    INDEX_EF_SEARCH: int = int(os.getenv("INDEX_EF_SEARCH", "64"))
+    INDEX_EMBEDS_DTYPE: str = os.getenv("INDEX_EMBEDS_DTYPE", "float32")  # float32 | float16 (course_embeds.npy)
+    INDEX_MMAP: bool = os.getenv("INDEX_MMAP", "true").lower() == "true"  # share index artifacts between workers via mmap
+    INDEX_RELOAD_CHECK_SECONDS: float = float(os.getenv("INDEX_RELOAD_CHECK_SECONDS", "1.0"))
+    EMBED_CACHE_SIZE: int = int(os.getenv("EMBED_CACHE_SIZE", "10000"))  # 0 disables the cache
+    EMBED_CACHE_TTL_SECONDS: float = float(os.getenv("EMBED_CACHE_TTL_SECONDS", "86400"))
+    EMBED_CACHE_REDIS: bool = os.getenv("EMBED_CACHE_REDIS", "false").lower() == "true"
+    EMBED_CACHE_LOWERCASE: bool = os.getenv("EMBED_CACHE_LOWERCASE", "true").lower() == "true"
+    EMBED_BATCHING: bool = os.getenv("EMBED_BATCHING", "true").lower() == "true"
+    EMBED_BATCH_MAX_SIZE: int = int(os.getenv("EMBED_BATCH_MAX_SIZE", "64"))
+    EMBED_BATCH_MAX_WAIT_MS: float = float(os.getenv("EMBED_BATCH_MAX_WAIT_MS", "5"))
+    USER_EMBEDDINGS_ENABLED: bool = os.getenv("USER_EMBEDDINGS_ENABLED", "true").lower() == "true"
+    USER_EMBEDDINGS_DIR: str = os.getenv("USER_EMBEDDINGS_DIR", "./models/user_embeddings")
+    MATCH_BATCH_CHUNK_SIZE: int = int(os.getenv("MATCH_BATCH_CHUNK_SIZE", "256"))
+    MATCH_CACHE_SIZE: int = int(os.getenv("MATCH_CACHE_SIZE", "5000"))  # 0 disables the cache
+    MATCH_CACHE_TTL_SECONDS: float = float(os.getenv("MATCH_CACHE_TTL_SECONDS", "600"))
+    MATCH_CACHE_REDIS: bool = os.getenv("MATCH_CACHE_REDIS", "false").lower() == "true"
+    SESSION_STORE_SIZE: int = int(os.getenv("SESSION_STORE_SIZE", "10000"))  # learners whose session state is kept per worker
+    SESSION_TTL_SECONDS: float = float(os.getenv("SESSION_TTL_SECONDS", "86400"))
+    SESSION_STORE_REDIS: bool = os.getenv("SESSION_STORE_REDIS", "false").lower() == "true"
+    RECS_TOP_K: int = int(os.getenv("RECS_TOP_K", "20"))
+    RECS_MAX_AGE_SECONDS: float = float(os.getenv("RECS_MAX_AGE_SECONDS", "129600"))  # 36h: a missed nightly run still serves
+    HYBRID_RRF_K: int = int(os.getenv("HYBRID_RRF_K", "60"))
+    HYBRID_WORKERS: int = int(os.getenv("HYBRID_WORKERS", "4"))
+    CONSUMER_GROUP: str = os.getenv("CONSUMER_GROUP", "recommendations")
+    CONSUMER_WORKERS: int = int(os.getenv("CONSUMER_WORKERS", "2"))
+    CONSUMER_BATCH_SIZE: int = int(os.getenv("CONSUMER_BATCH_SIZE", "10"))
+    CONSUMER_BLOCK_MS: int = int(os.getenv("CONSUMER_BLOCK_MS", "5000"))
+    CONSUMER_CLAIM_IDLE_MS: int = int(os.getenv("CONSUMER_CLAIM_IDLE_MS", "60000"))
+    CONSUMER_CLAIM_INTERVAL_SECONDS: float = float(os.getenv("CONSUMER_CLAIM_INTERVAL_SECONDS", "30"))
+    CONSUMER_MAX_DELIVERIES: int = int(os.getenv("CONSUMER_MAX_DELIVERIES", "5"))
+    CONSUMER_DEAD_LETTER_MAXLEN: int = int(os.getenv("CONSUMER_DEAD_LETTER_MAXLEN", "10000"))
+    BEHAVIOR_BATCH_N_JOBS: int = int(os.getenv("BEHAVIOR_BATCH_N_JOBS", "-1"))  # threads for /behavior/score/batch predictions
     TOP_K: int = 10
     class Config:
         env_file = ".env"
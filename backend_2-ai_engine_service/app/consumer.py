@@ -1,56 +1,335 @@
 import redis
 import json
 import time
+import socket
+import argparse
+import multiprocessing
 from .config import settings
-from .matcher import semantic_search, apply_filters, compose_scores
+from .user_embeddings import embed_profiles
+from .indexer import get_snapshot
+from .matcher import profile_text, _rank
+from .recommendations import record_profiles
 import requests
 
 r = redis.from_url(settings.REDIS_URL, decode_responses=True)
 
 STREAM_KEY = "shikshadisha:actions"
 NOTIF_STREAM = "shikshadisha:notifications"
+DEAD_LETTER_STREAM = "shikshadisha:actions:dead"
+METRICS_KEY = "shikshadisha:consumer:metrics:"
 
-def process_event(event):
-    # event is dict with keys like {"user_id":..., "type":..., "payload":...}
-    user_id = event.get('user_id')
-    # We'll assume the event payload contains at least a compact profile (skills, experience, etc.)
-    profile = event.get('profile') or {}
-    top_k = 5
-    sem = semantic_search(profile, top_k=50)
-    filtered = apply_filters(sem, profile, filters={})
-    scored = compose_scores(filtered, profile)
-    top = scored[:top_k]
-    # Prepare a notification payload summarizing top matches
-    body = {
+# Each notification lists the top NOTIFY_TOP_K of NOTIFY_POOL candidates,
+# the same as the former per-event semantic_search(top_k=50) + compose_scores.
+NOTIFY_TOP_K = 5
+NOTIFY_POOL = 100
+
+
+def _notification(user_id, top):
+    return {
         "user_id": user_id,
         "title": "Updated learning pathway",
         "body": f"We found {len(top)} recommended courses based on your recent activity.",
-        "metadata": {"matches": [ {"course_id": t['course_id'], "title": t['title'], "score": t['final_score']} for t in top ]}
+        "metadata": {"matches": [ {"course_id": t['course_id'], "title": t['title'], "score": t['_final_score']} for t in top ]}
     }
-    # publish to notif stream (or call notifications API)
+
+
+def build_notifications(events):
+    """
+    One notification body per event.  Profiles missing from the user
+    embedding store are embedded in one encode call, and all are searched
+    with one multi-query index search.
+    """
+    # event is dict with keys like {"user_id":..., "type":..., "payload":...}
+    # We'll assume the event contains at least a compact profile (skills, experience, etc.)
+    profiles = [event.get('profile') or {} for event in events]
+    snapshot = get_snapshot()
+    embs = embed_profiles("match", [event.get('user_id') for event in events], [profile_text(p) for p in profiles])
+    ranked = _rank(snapshot, profiles, embs, None, NOTIFY_TOP_K, NOTIFY_POOL)
+    return [_notification(event.get('user_id'), top) for event, (top, _) in zip(events, ranked)]
+
+
+def publish_notifications(bodies, profiles=(), client=None):
+    """
+    XADD every notification, and record the learners' latest profiles for
+    the nightly recommendations job, in one pipelined round-trip.  Errors
+    propagate so events stay pending.
+    """
+    pipe = (client or r).pipeline(transaction=False)
+    for body in bodies:
+        pipe.xadd(NOTIF_STREAM, {"payload": json.dumps(body)})
+    record_profiles(profiles, client=pipe)
+    pipe.execute()
+
+
+def process_events(events):
+    profiles = [dict(event.get('profile') or {}, user_id=event.get('user_id')) for event in events]
+    publish_notifications(build_notifications(events), profiles)
+
+
+def process_event(event):
+    process_events([event])
+
+
+def ensure_group(client, group):
+    """Create the consumer group (and stream) if needed, starting at new events."""
     try:
-        r.xadd(NOTIF_STREAM, {"payload": json.dumps(body)})
-    except Exception as e:
-        print("Failed to publish notif:", e)
-
-def run_consumer(group="default", consumer_name="consumer1"):
-    # Simple polling consumer for demo. For production use consumer groups with XREADGROUP.
-    print("Starting consumer polling", STREAM_KEY)
-    last_id = "$"
-    while True:
-        try:
-            res = r.xread({STREAM_KEY: last_id}, count=10, block=5000)
-            if not res:
+        client.xgroup_create(STREAM_KEY, group, id="$", mkstream=True)
+    except redis.ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+class ConsumerWorker:
+    """
+    One consumer in the group.  Reads with XREADGROUP, acks only after an
+    event was processed, periodically takes over entries other consumers
+    left pending for CONSUMER_CLAIM_IDLE_MS (XAUTOCLAIM) and moves entries
+    that keep failing, or cannot be parsed, to the dead-letter stream.
+    Counters are written to a Redis hash so consumer_stats() can report on
+    workers in every process.
+    """
+
+    def __init__(self, group, name, client=None):
+        self.group = group
+        self.name = name
+        self.client = client or redis.from_url(settings.REDIS_URL, decode_responses=True)
+        self.started_at = time.time()
+        self.processed = 0
+        self.failed = 0
+        self.dead_lettered = 0
+        self.reclaimed = 0
+        self.deduplicated = 0
+        self.batches = 0
+        self._last_claim = 0.0
+        self._last_report = 0.0
+
+    def run(self, stop=None):
+        ensure_group(self.client, self.group)
+        print(f"Consumer {self.name} reading {STREAM_KEY} as group {self.group}")
+        recovered = False
+        while stop is None or not stop.is_set():
+            try:
+                if not recovered:
+                    # Entries delivered to this consumer before a restart come first.
+                    self.recover_pending()
+                    recovered = True
+                if time.monotonic() - self._last_claim >= settings.CONSUMER_CLAIM_INTERVAL_SECONDS:
+                    self._last_claim = time.monotonic()
+                    self.claim_stale()
+                self.handle(self._read(">", block=settings.CONSUMER_BLOCK_MS))
+                self.report()
+            except Exception as e:
+                # Never let one error end the worker; back off and carry on.
+                print(f"Consumer {self.name} error:", e)
+                time.sleep(2)
+
+    def recover_pending(self):
+        """Handle all of this consumer's pending entries, a batch at a time."""
+        last_id = "0"
+        while True:
+            res = self.client.xreadgroup(self.group, self.name, {STREAM_KEY: last_id},
+                                         count=settings.CONSUMER_BATCH_SIZE)
+            entries = [item for _, items in res or [] for item in items]
+            if not entries:
+                return
+            self._ack_deleted([item_id for item_id, data in entries if data is None])
+            self.handle([item for item in entries if item[1] is not None], claimed=True)
+            last_id = entries[-1][0]
+
+    def _ack_deleted(self, ids):
+        """Drop pending entries whose stream data was deleted (XDEL/MAXLEN); they can't be processed."""
+        if ids:
+            self.client.xack(STREAM_KEY, self.group, *ids)
+
+    def _read(self, last_id, block=None):
+        res = self.client.xreadgroup(self.group, self.name, {STREAM_KEY: last_id},
+                                     count=settings.CONSUMER_BATCH_SIZE, block=block)
+        return [item for _, items in res or [] for item in items if item[1] is not None]
+
+    def claim_stale(self):
+        """Take over entries idle in other consumers' pending lists."""
+        start = "0-0"
+        while True:
+            res = self.client.xautoclaim(STREAM_KEY, self.group, self.name,
+                                         min_idle_time=settings.CONSUMER_CLAIM_IDLE_MS,
+                                         start_id=start, count=settings.CONSUMER_BATCH_SIZE)
+            start, items = res[0], [item for item in res[1] if item[1] is not None]
+            # Deleted entries: listed separately by Redis 7, with no data by 6.2.
+            deleted = list(res[2]) if len(res) > 2 else []
+            self._ack_deleted(deleted + [item[0] for item in res[1] if item[1] is None])
+            if items:
+                self.reclaimed += len(items)
+                self.handle(items, claimed=True)
+            if start == "0-0" or not (res[1] or deleted):
+                return
+
+    def _deliveries(self, items):
+        pipe = self.client.pipeline(transaction=False)
+        for item_id, _ in items:
+            pipe.xpending_range(STREAM_KEY, self.group, min=item_id, max=item_id, count=1)
+        return {p['message_id']: p['times_delivered'] for res in pipe.execute() for p in res}
+
+    def handle(self, items, claimed=False):
+        """
+        Process a read batch as a unit.  Events are de-duplicated by user_id
+        (the latest event wins and acks the others) and processed together;
+        `claimed` entries are redeliveries and get their attempt count checked.
+        """
+        if not items:
+            return
+        deliveries = self._deliveries(items) if claimed else {}
+        done = []
+        latest = {}
+        for item_id, data in items:
+            payload = data.get("payload")
+            if not payload:
+                done.append(item_id)
+                continue
+            try:
+                event = json.loads(payload)
+            except ValueError as e:
+                event = None
+                error = f"invalid payload: {e}"
+            else:
+                error = None if isinstance(event, dict) else "invalid payload: not a JSON object"
+            if error:
+                self.dead_letter(item_id, payload, error, 1)
+                done.append(item_id)
+                continue
+            attempts = deliveries.get(item_id, 1)
+            if attempts > settings.CONSUMER_MAX_DELIVERIES:
+                self.dead_letter(item_id, payload, "too many deliveries", attempts)
+                done.append(item_id)
                 continue
-            for stream, items in res:
-                for item_id, data in items:
-                    # data: dict of utf strings
-                    payload = data.get("payload")
-                    if not payload:
-                        continue
-                    event = json.loads(payload)
-                    process_event(event)
-                    last_id = item_id
+            user_id = event.get('user_id')
+            key = ("user", user_id) if user_id is not None else ("entry", item_id)
+            if key in latest:
+                self.deduplicated += 1
+                latest[key][1].append(item_id)
+                latest[key][0] = event
+            else:
+                latest[key] = [event, [item_id]]
+        done.extend(self._process(list(latest.values())))
+        if done:
+            self.client.xack(STREAM_KEY, self.group, *done)
+
+    def _process(self, groups):
+        """Ids of the entries handled successfully; failures stay pending."""
+        if not groups:
+            return []
+        try:
+            process_events([event for event, _ in groups])
+            succeeded = groups
         except Exception as e:
-            print("Consumer error:", e)
-            time.sleep(2)
+            # Retry one by one so a single bad event doesn't hold back the rest.
+            print(f"Consumer {self.name} batch of {len(groups)} failed, retrying individually:", e)
+            succeeded = []
+            for event, ids in groups:
+                try:
+                    process_events([event])
+                except Exception as e:
+                    # Left pending; XAUTOCLAIM retries it once it has been idle.
+                    self.failed += len(ids)
+                    print(f"Consumer {self.name} failed on {ids[-1]}:", e)
+                    continue
+                succeeded.append((event, ids))
+        ids = [item_id for _, group_ids in succeeded for item_id in group_ids]
+        self.processed += len(ids)
+        self.batches += 1
+        return ids
+
+    def dead_letter(self, item_id, payload, error, deliveries):
+        self.dead_lettered += 1
+        self.client.xadd(DEAD_LETTER_STREAM, {
+            "id": item_id, "payload": payload, "error": error,
+            "deliveries": deliveries, "consumer": self.name
+        }, maxlen=settings.CONSUMER_DEAD_LETTER_MAXLEN, approximate=True)
+
+    def report(self, force=False):
+        now = time.time()
+        if not force and now - self._last_report < 5:
+            return
+        self._last_report = now
+        key = METRICS_KEY + self.group
+        self.client.hset(key, self.name, json.dumps({
+            "processed": self.processed, "failed": self.failed,
+            "dead_lettered": self.dead_lettered, "reclaimed": self.reclaimed,
+            "deduplicated": self.deduplicated, "batches": self.batches,
+            "started_at": self.started_at, "updated_at": now
+        }))
+
+
+def consumer_stats(group=None, client=None):
+    """Group lag/pending from XINFO GROUPS plus per-worker counters and throughput."""
+    client = client or r
+    group = group or settings.CONSUMER_GROUP
+    try:
+        info = next((g for g in client.xinfo_groups(STREAM_KEY) if g.get('name') == group), None)
+    except redis.ResponseError:
+        # The stream does not exist until the first event or consumer.
+        info = None
+    workers = {}
+    for name, raw in client.hgetall(METRICS_KEY + group).items():
+        metrics = json.loads(raw)
+        elapsed = max(metrics["updated_at"] - metrics["started_at"], 1e-9)
+        metrics["events_per_second"] = round(metrics["processed"] / elapsed, 3)
+        workers[name] = metrics
+    return {
+        "stream": STREAM_KEY,
+        "group": group,
+        "stream_length": client.xlen(STREAM_KEY),
+        "lag": info.get('lag') if info else None,
+        "pending": info.get('pending') if info else None,
+        "last_delivered_id": info.get('last-delivered-id') if info else None,
+        "dead_letters": client.xlen(DEAD_LETTER_STREAM),
+        "processed": sum(w["processed"] for w in workers.values()),
+        "events_per_second": round(sum(w["events_per_second"] for w in workers.values()), 3),
+        "workers": workers,
+    }
+
+
+def _run_worker(group, name):
+    worker = ConsumerWorker(group, name)
+    try:
+        worker.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        try:
+            worker.report(force=True)
+        except redis.RedisError:
+            pass
+
+
+def run_consumer(group=None, consumer_name=None, workers=None):
+    """
+    Run `workers` consumer processes in one group.  Names are stable across
+    restarts (`<consumer_name>-<i>`) so each worker picks up its own pending
+    entries when it comes back.
+    """
+    group = group or settings.CONSUMER_GROUP
+    consumer_name = consumer_name or socket.gethostname()
+    workers = workers or settings.CONSUMER_WORKERS
+    ensure_group(r, group)
+    if workers == 1:
+        _run_worker(group, f"{consumer_name}-0")
+        return
+    processes = [multiprocessing.Process(target=_run_worker, args=(group, f"{consumer_name}-{i}"), daemon=True)
+                 for i in range(workers)]
+    for p in processes:
+        p.start()
+    try:
+        for p in processes:
+            p.join()
+    except KeyboardInterrupt:
+        for p in processes:
+            p.terminate()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recommendation consumer for " + STREAM_KEY)
+    parser.add_argument("--group", default=settings.CONSUMER_GROUP)
+    parser.add_argument("--name", default=None, help="consumer name prefix (default: hostname)")
+    parser.add_argument("--workers", type=int, default=settings.CONSUMER_WORKERS)
+    args = parser.parse_args()
+    run_consumer(args.group, args.name, args.workers)
@@ -1,7 +1,13 @@
-
+import asyncio
+import hashlib
+import queue
+import threading
+import time
+from concurrent.futures import Future
 import numpy as np
 from sentence_transformers import SentenceTransformer
 from .config import settings
+from .cache import LRUCache, RedisTier
 
 _model = None
 
@@ -11,8 +17,182 @@ def get_model():
         _model = SentenceTransformer(settings.EMBEDDING_MODEL)
     return _model
 
-def embed_texts(texts):
+
+def _encode(texts):
     model = get_model()
     embs = model.encode(texts, convert_to_numpy=True, show_progress_bar=False)
     embs = embs / np.linalg.norm(embs, axis=1, keepdims=True)
     return np.array(embs, dtype=np.float32)
+
+
+class EmbeddingBatcher:
+    """
+    Coalesces concurrent small encode requests into one model.encode call.
+    Callers submit a few texts and get a Future; a dedicated worker thread
+    waits up to max_wait_ms for more requests (or until max_batch_size texts
+    are queued), encodes them as one batch and resolves every Future with
+    its slice of the result.
+    """
+
+    def __init__(self, max_batch_size, max_wait_ms):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.texts = 0
+
+    def _ensure_worker(self):
+        # Started lazily so each forked uvicorn worker gets its own thread.
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                    self._thread.start()
+
+    def submit(self, texts) -> Future:
+        future = Future()
+        self._ensure_worker()
+        self._queue.put((list(texts), future))
+        return future
+
+    def encode(self, texts):
+        return self.submit(texts).result()
+
+    async def encode_async(self, texts):
+        return await asyncio.wrap_future(self.submit(texts))
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        size = len(batch[0][0])
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            batch.append(item)
+            size += len(item[0])
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            texts = [text for item_texts, _ in batch for text in item_texts]
+            try:
+                embs = _encode(texts)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.texts += len(texts)
+            offset = 0
+            for item_texts, future in batch:
+                future.set_result(embs[offset:offset + len(item_texts)])
+                offset += len(item_texts)
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'texts': self.texts,
+            'avg_batch_size': round(self.texts / self.batches, 2) if self.batches else 0.0,
+            'queued': self._queue.qsize()
+        }
+
+
+batcher = EmbeddingBatcher(settings.EMBED_BATCH_MAX_SIZE, settings.EMBED_BATCH_MAX_WAIT_MS)
+
+
+def encode_texts(texts):
+    """Encode uncached texts, sharing a batch with concurrent callers when batching is on."""
+    if settings.EMBED_BATCHING and 0 < len(texts) <= settings.EMBED_BATCH_MAX_SIZE:
+        return batcher.encode(texts)
+    return _encode(texts)
+
+
+def normalize_text(text):
+    # The default model is uncased, so case and spacing differences between
+    # otherwise identical profiles should share one cache entry.
+    text = " ".join(str(text).split())
+    return text.lower() if settings.EMBED_CACHE_LOWERCASE else text
+
+
+class EmbeddingCache:
+    """
+    In-process LRU of query embeddings keyed by (model, normalized text),
+    optionally backed by Redis so every worker shares warm entries.
+    """
+
+    def __init__(self):
+        self.local = LRUCache(settings.EMBED_CACHE_SIZE, ttl=settings.EMBED_CACHE_TTL_SECONDS)
+        self.shared = RedisTier("shikshadisha:emb:", ttl=settings.EMBED_CACHE_TTL_SECONDS) if settings.EMBED_CACHE_REDIS else None
+
+    @staticmethod
+    def key(normalized_text):
+        return hashlib.sha1(f"{settings.EMBEDDING_MODEL}\x00{normalized_text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys):
+        found = {}
+        for key in keys:
+            vec = self.local.get(key)
+            if vec is not None:
+                found[key] = vec
+        if self.shared is not None:
+            missing = [k for k in keys if k not in found]
+            for key, raw in self.shared.get_many(missing).items():
+                vec = np.frombuffer(raw, dtype=np.float32)
+                self.local.set(key, vec)
+                found[key] = vec
+        return found
+
+    def put_many(self, vectors):
+        for key, vec in vectors.items():
+            vec = np.array(vec, dtype=np.float32)
+            vec.setflags(write=False)
+            self.local.set(key, vec)
+        if self.shared is not None:
+            self.shared.set_many({k: np.asarray(v, dtype=np.float32).tobytes() for k, v in vectors.items()})
+
+    def stats(self):
+        stats = {'local': self.local.stats()}
+        if self.shared is not None:
+            stats['redis'] = self.shared.stats()
+        return stats
+
+
+embedding_cache = EmbeddingCache()
+
+
+def embed_texts(texts, use_cache=True):
+    """
+    L2-normalised float32 embeddings, one row per text.  Query-time callers
+    go through the embedding cache; bulk catalog indexing passes
+    use_cache=False so it doesn't evict live query entries.
+    """
+    if not use_cache:
+        return _encode(texts)
+    if settings.EMBED_CACHE_SIZE <= 0:
+        return encode_texts(texts)
+
+    # The normalized text is only the cache key; the model sees the original.
+    keys = [EmbeddingCache.key(normalize_text(t)) for t in texts]
+    found = embedding_cache.get_many(list(dict.fromkeys(keys)))
+
+    pending = {}
+    for key, text in zip(keys, texts):
+        if key not in found and key not in pending:
+            pending[key] = text
+    if pending:
+        fresh = encode_texts(list(pending.values()))
+        computed = dict(zip(pending.keys(), fresh))
+        embedding_cache.put_many(computed)
+        found.update(computed)
+
+    if not keys:
+        return _encode(texts)
+    return np.stack([found[k] for k in keys]).astype(np.float32, copy=False)
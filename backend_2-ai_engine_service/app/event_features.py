@@ -0,0 +1,312 @@
+"""
+Single-pass statistics over a learner's raw events.
+
+BehaviorAnalyzer, LearnerMonitor and LearningStyleClassifier derive their
+features from an EventStats instead of building a DataFrame per request:
+event/content type tallies are Counters, timestamps are parsed with
+datetime.fromisoformat and gap statistics are kept while events are added.
+Values match what the former value_counts / nunique / mode / diff code
+computed, missing values skipped.  The one exception is ties for the most
+frequent content type in LearnerMonitor, which value_counts' unstable sort
+broke arbitrarily; the type seen first in time order now wins.
+"""
+import math
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+import numpy as np
+import pandas as pd
+
+# Fields the feature extractors look at.  `fields` records which of them
+# appeared on any event, like DataFrame columns did.
+FIELDS = ("event_type", "content_type", "content_id", "timestamp", "scroll_depth")
+
+# A gap longer than this between consecutive events is an inactive period.
+INACTIVE_GAP_SECONDS = 300
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_NAIVE_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+_INACTIVE_GAP = INACTIVE_GAP_SECONDS * 1_000_000
+
+
+def _missing(value):
+    # NaN and NaT are the values not equal to themselves.
+    return value is None or value != value
+
+
+def parse_timestamp(value):
+    """
+    Microseconds since the epoch, or None for a missing value.  ISO-8601
+    strings go through datetime.fromisoformat; anything else (or strings it
+    rejects) through pd.Timestamp, as pd.to_datetime would.  Naive times
+    are taken as UTC.
+    """
+    if _missing(value):
+        return None
+    parsed = None
+    if isinstance(value, str):
+        try:
+            parsed = datetime.fromisoformat(value)
+        except ValueError:
+            pass
+    elif isinstance(value, datetime):
+        parsed = value
+    if parsed is None:
+        parsed = pd.Timestamp(value)
+        if parsed is pd.NaT:
+            return None
+    return (parsed - (_NAIVE_EPOCH if parsed.tzinfo is None else _EPOCH)) // _MICROSECOND
+
+
+class EventStats:
+    """
+    Aggregates of one learner's events, built in one pass with add():
+    event and content type counts, distinct content ids, scroll depth and
+    timestamp span/gap statistics.  Gaps are between consecutive events in
+    time order; they are tracked on the fly while events arrive in order
+    and recomputed from the sorted timestamps otherwise.
+
+    With keep_times=False no per-event data is kept, so the state stays the
+    same size however many events are added (see session_store).  A late
+    event, older than the latest one seen, then still counts and can move
+    the session start, but does not split the gap it falls into.
+    """
+
+    def __init__(self, keep_times=True):
+        self.keep_times = keep_times
+        self.count = 0
+        self.fields = set()
+        self.event_types = Counter()
+        self.content_types = Counter()
+        # content type -> (earliest timestamp, arrival index) of its events
+        self._content_first = {}
+        self.content_ids = set()
+        self.scroll_sum = 0.0
+        self.scroll_count = 0
+        self.times = []
+        self.timed = 0
+        self.first_time = self.last_time = None
+        self.start = self.end = None
+        self.in_order = True
+        self._max_gap = 0
+        self._long_gaps = 0
+        self._long_gap_total = 0
+
+    def __len__(self):
+        return self.count
+
+    @classmethod
+    def from_events(cls, events):
+        stats = cls()
+        for event in events:
+            stats.add(event)
+        return stats
+
+    @classmethod
+    def from_array(cls, array):
+        """
+        Stats for a structured NumPy array with (some of) FIELDS as fields.
+        String fields use '' for missing values, `timestamp` is datetime64
+        (or ISO strings numpy can parse) and `scroll_depth` a float with NaN.
+        """
+        stats = cls()
+        names = set(array.dtype.names or ())
+        stats.count = len(array)
+        stats.fields = names & set(FIELDS)
+        if "event_type" in names:
+            stats.event_types = _tally(array["event_type"])
+        if "content_type" in names:
+            stats.content_types = _tally(array["content_type"])
+        if "content_id" in names:
+            stats.content_ids = set(_tally(array["content_id"]))
+        if "scroll_depth" in names:
+            depth = array["scroll_depth"].astype(np.float64)
+            depth = depth[~np.isnan(depth)]
+            stats.scroll_sum, stats.scroll_count = float(depth.sum()), len(depth)
+        if "timestamp" in names:
+            times = array["timestamp"].astype("datetime64[us]")
+            stats._set_times(times[~np.isnat(times)].astype(np.int64))
+        return stats
+
+    def add(self, event):
+        # Hot path: `value == value` is False for NaN/NaT, like _missing().
+        self.count += 1
+        if len(self.fields) < len(FIELDS):
+            self.fields.update(f for f in FIELDS if f in event)
+        time = parse_timestamp(event.get('timestamp'))
+        value = event.get('event_type')
+        if value is not None and value == value:
+            self.event_types[value] += 1
+        value = event.get('content_type')
+        if value is not None and value == value:
+            self.content_types[value] += 1
+            key = (math.inf if time is None else time, self.count)
+            if value not in self._content_first or key < self._content_first[value]:
+                self._content_first[value] = key
+        value = event.get('content_id')
+        if value is not None and value == value:
+            self.content_ids.add(value)
+        value = event.get('scroll_depth')
+        if value is not None and value == value:
+            self.scroll_sum += value
+            self.scroll_count += 1
+        if time is not None:
+            self._add_time(time)
+
+    def _add_time(self, time):
+        if self.timed:
+            gap = time - self.end
+            if gap >= 0:
+                if self.in_order:
+                    self._max_gap = max(self._max_gap, gap)
+                    if gap > _INACTIVE_GAP:
+                        self._long_gaps += 1
+                        self._long_gap_total += gap
+            elif self.keep_times:
+                # Recomputed from the sorted timestamps when asked for.
+                self.in_order = False
+        else:
+            self.first_time = time
+        self.timed += 1
+        if self.keep_times:
+            self.times.append(time)
+        self.last_time = time
+        self.start = time if self.start is None else min(self.start, time)
+        self.end = time if self.end is None else max(self.end, time)
+
+    def _set_times(self, times):
+        self.times = times.tolist()
+        self.timed = len(times)
+        if not len(times):
+            return
+        self.first_time, self.last_time = self.times[0], self.times[-1]
+        self.start, self.end = int(times.min()), int(times.max())
+        gaps = np.diff(times)
+        self.in_order = bool((gaps >= 0).all())
+        if self.in_order:
+            self._set_gaps(gaps)
+
+    def _set_gaps(self, gaps):
+        long_gaps = gaps[gaps > _INACTIVE_GAP]
+        self._max_gap = int(gaps.max()) if len(gaps) else 0
+        self._long_gaps = len(long_gaps)
+        self._long_gap_total = int(long_gaps.sum())
+
+    def _ordered(self):
+        if not self.in_order:
+            self._set_gaps(np.diff(np.sort(np.array(self.times, dtype=np.int64))))
+            self.in_order = True
+        return self
+
+    @property
+    def duration_seconds(self):
+        return (self.end - self.start) / 1e6 if self.timed else 0
+
+    @property
+    def mean_gap_seconds(self):
+        """Mean gap between consecutive events in time order."""
+        return self.duration_seconds / (self.timed - 1) if self.timed > 1 else 0
+
+    @property
+    def mean_arrival_gap_seconds(self):
+        """Mean difference between consecutive events in the order they were given."""
+        return (self.last_time - self.first_time) / 1e6 / (self.timed - 1) if self.timed > 1 else 0
+
+    @property
+    def max_gap_seconds(self):
+        return self._ordered()._max_gap / 1e6
+
+    @property
+    def long_gaps(self):
+        """Gaps longer than INACTIVE_GAP_SECONDS."""
+        return self._ordered()._long_gaps
+
+    @property
+    def long_gap_seconds(self):
+        return self._ordered()._long_gap_total / 1e6
+
+    @property
+    def scroll_depth_mean(self):
+        return self.scroll_sum / self.scroll_count if self.scroll_count else float('nan')
+
+    def to_dict(self):
+        """JSON-serializable aggregates, without per-event timestamps."""
+        self._ordered()
+        return {
+            'count': self.count,
+            'fields': sorted(self.fields),
+            'event_types': dict(self.event_types),
+            'content_types': dict(self.content_types),
+            'content_first': {k: [None if t == math.inf else t, i] for k, (t, i) in self._content_first.items()},
+            'content_ids': list(self.content_ids),
+            'scroll_sum': self.scroll_sum,
+            'scroll_count': self.scroll_count,
+            'timed': self.timed,
+            'first_time': self.first_time,
+            'last_time': self.last_time,
+            'start': self.start,
+            'end': self.end,
+            'max_gap': self._max_gap,
+            'long_gaps': self._long_gaps,
+            'long_gap_total': self._long_gap_total,
+        }
+
+    @classmethod
+    def from_dict(cls, state):
+        """Running stats (keep_times=False) restored from to_dict()."""
+        stats = cls(keep_times=False)
+        stats.count = state['count']
+        stats.fields = set(state['fields'])
+        stats.event_types = Counter(state['event_types'])
+        stats.content_types = Counter(state['content_types'])
+        stats._content_first = {k: (math.inf if t is None else t, i) for k, (t, i) in state['content_first'].items()}
+        stats.content_ids = set(state['content_ids'])
+        stats.scroll_sum = state['scroll_sum']
+        stats.scroll_count = state['scroll_count']
+        stats.timed = state['timed']
+        stats.first_time, stats.last_time = state['first_time'], state['last_time']
+        stats.start, stats.end = state['start'], state['end']
+        stats._max_gap = state['max_gap']
+        stats._long_gaps = state['long_gaps']
+        stats._long_gap_total = state['long_gap_total']
+        return stats
+
+    def most_common_content_type(self, default):
+        """
+        Most frequent content type; on ties the one seen first in time
+        order (arrival order for events without a timestamp).
+        """
+        if not self.content_types:
+            return default
+        top = max(self.content_types.values())
+        tied = [value for value, n in self.content_types.items() if n == top]
+        return min(tied, key=lambda value: self._content_first.get(value, (math.inf, math.inf)))
+
+    def content_type_mode(self, default):
+        """Most frequent content type, the smallest on ties (Series.mode())."""
+        if not self.content_types:
+            return default
+        top = max(self.content_types.values())
+        return min(value for value, n in self.content_types.items() if n == top)
+
+
+def _tally(column):
+    # Counter in first-occurrence order so most_common() breaks ties like value_counts.
+    values, first, counts = np.unique(column, return_index=True, return_counts=True)
+    tally = Counter()
+    for i in np.argsort(first):
+        value = values[i].item()
+        if value != '':
+            tally[value] = int(counts[i])
+    return tally
+
+
+def event_stats(events):
+    """EventStats for a list of event dicts, a DataFrame of events or a structured array (or an EventStats)."""
+    if isinstance(events, EventStats):
+        return events
+    if isinstance(events, pd.DataFrame):
+        return EventStats.from_events(events.to_dict(orient='records'))
+    if isinstance(events, np.ndarray) and events.dtype.names:
+        return EventStats.from_array(events)
+    return EventStats.from_events(events)
@@ -0,0 +1,77 @@
+import numpy as np
+
+# Filters understood by apply_filters and pushed into retrieval.
+EQUALITY_FILTERS = ("nsqf_level", "region", "language")
+RANGE_FILTERS = ("max_duration_months", "min_nsqf_level")
+
+
+def _as_number(value, default=np.nan):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _as_text(value):
+    return value.lower() if isinstance(value, str) else ""
+
+
+class AttributeBitmaps:
+    """
+    Precomputed boolean masks over course positions, one per distinct
+    nsqf_level / region / language value, plus numeric columns for the
+    range filters.  mask() combines them with the same semantics as
+    matcher.apply_filters so filters can be applied inside the ANN search.
+    """
+
+    def __init__(self, records):
+        self.size = len(records)
+        self.nsqf_level = np.array([_as_number(r.get('nsqf_level')) for r in records], dtype=np.float64)
+        self.duration_months = np.array([_as_number(r.get('duration_months'), 0.0) for r in records], dtype=np.float64)
+        self._bitmaps = {
+            'nsqf_level': self._group(self.nsqf_level.tolist()),
+            'region': self._group([_as_text(r.get('region', '')) for r in records]),
+            'language': self._group([_as_text(r.get('language', '')) for r in records]),
+        }
+
+    def _group(self, values):
+        positions = {}
+        for pos, value in enumerate(values):
+            positions.setdefault(value, []).append(pos)
+        bitmaps = {}
+        for value, rows in positions.items():
+            bitmap = np.zeros(self.size, dtype=bool)
+            bitmap[rows] = True
+            bitmaps[value] = bitmap
+        return bitmaps
+
+    def _lookup(self, attribute, value):
+        bitmap = self._bitmaps[attribute].get(value)
+        return bitmap if bitmap is not None else np.zeros(self.size, dtype=bool)
+
+    def mask(self, filters):
+        """Boolean mask of courses passing `filters`, or None if nothing is filtered."""
+        if not filters:
+            return None
+
+        mask = None
+
+        def narrow(current, other):
+            return other.copy() if current is None else current & other
+
+        if 'nsqf_level' in filters:
+            mask = narrow(mask, self._lookup('nsqf_level', _as_number(filters['nsqf_level'])))
+
+        if filters.get('region'):
+            mask = narrow(mask, self._lookup('region', filters['region'].lower()))
+
+        if filters.get('language'):
+            mask = narrow(mask, self._lookup('language', filters['language'].lower()))
+
+        if 'max_duration_months' in filters:
+            mask = narrow(mask, ~(self.duration_months > _as_number(filters['max_duration_months'])))
+
+        if 'min_nsqf_level' in filters:
+            mask = narrow(mask, ~(self.nsqf_level < _as_number(filters['min_nsqf_level'])))
+
+        return mask
@@ -0,0 +1,90 @@
+from concurrent.futures import ThreadPoolExecutor
+from .config import settings
+from .catalog import get_catalog
+from .embeddings import embed_texts
+from .indexer import get_snapshot
+from .matcher import RERANK_POOL, profile_text, _rank
+from .user_embeddings import embed_profiles
+
+# Keyword retrieval runs here while the request thread embeds the query and
+# searches FAISS; both mostly release the GIL inside numpy / faiss.
+_executor = ThreadPoolExecutor(max_workers=settings.HYBRID_WORKERS, thread_name_prefix="hybrid")
+
+
+def reciprocal_rank_fusion(semantic, keyword, k=None):
+    """
+    Fuse two rankings of (course_id, score) pairs with reciprocal rank
+    fusion, 1 / (k + rank) summed over the lists a course appears in.
+    Returns [(course_id, rrf_score, semantic_score, keyword_score)] best
+    first; a score is None when the course was not in that list.
+    """
+    k = settings.HYBRID_RRF_K if k is None else k
+    fused = {}
+    for slot, ranking in ((2, semantic), (3, keyword)):
+        for rank, (course_id, score) in enumerate(ranking, 1):
+            entry = fused.get(course_id)
+            if entry is None:
+                entry = fused[course_id] = [course_id, 0.0, None, None]
+            entry[1] += 1.0 / (k + rank)
+            entry[slot] = score
+    return sorted((tuple(e) for e in fused.values()), key=lambda e: e[1], reverse=True)
+
+
+def _keyword_ranking(catalog, query, limit, filters):
+    positions, scores, _ = catalog.search_index.search(query, limit=limit, allowed=catalog.bitmaps.mask(filters))
+    return [(catalog.course_ids[p], float(s)) for p, s in zip(positions, scores)]
+
+
+def _annotate(course, rrf_score, semantic_score, keyword_score):
+    course['_rrf_score'] = rrf_score
+    if semantic_score is not None:
+        course['_semantic_score'] = semantic_score
+    if keyword_score is not None:
+        course['_keyword_score'] = keyword_score
+    return course
+
+
+def hybrid_match(profile, top_k=10, filters=None):
+    """
+    /match in hybrid mode: the profile's semantic ranking (with the usual
+    compose_scores boosts) fused with a BM25 ranking of the same profile
+    text.  Returns (top_k matches, number of fused candidates).  Each side
+    contributes up to RERANK_POOL candidates, like semantic /match.
+    """
+    pool = max(RERANK_POOL, top_k)
+    catalog = get_catalog()
+    query = profile_text(profile)
+    keyword = _executor.submit(_keyword_ranking, catalog, query, pool, filters)
+
+    snapshot = get_snapshot()
+    embs = embed_profiles("match", [profile.get('user_id')], [query])
+    semantic, _ = _rank(snapshot, [profile], embs, filters, pool, pool)[0]
+    by_id = {m['course_id']: m for m in semantic}
+    fused = reciprocal_rank_fusion([(m['course_id'], m['_final_score']) for m in semantic], keyword.result())
+
+    top = fused[:top_k]
+    keyword_only = [course_id for course_id, *_ in top if course_id not in by_id]
+    by_id.update(zip(keyword_only, catalog.records(catalog.row_of(c) for c in keyword_only)))
+    matches = [_annotate(by_id[course_id], *scores) for course_id, *scores in top]
+    return matches, len(fused)
+
+
+def hybrid_search(query, limit=20, filters=None):
+    """
+    /courses/search in hybrid mode: BM25 and embedding similarity over the
+    query text, fused with RRF.  Returns (catalog records, number of fused
+    candidates).
+    """
+    pool = max(RERANK_POOL, limit)
+    catalog = get_catalog()
+    keyword = _executor.submit(_keyword_ranking, catalog, query, pool, filters)
+
+    snapshot = get_snapshot()
+    scores, positions = snapshot.search(embed_texts([query]), pool, mask=snapshot.filter_mask(filters))
+    semantic = [(snapshot.meta[p]['course_id'], float(s)) for s, p in zip(scores[0], positions[0]) if p >= 0]
+    # The index can briefly lag a catalog reload; drop courses it no longer has.
+    fused = [f for f in reciprocal_rank_fusion(semantic, keyword.result()) if catalog.row_of(f[0]) is not None]
+
+    top = fused[:limit]
+    records = catalog.records(catalog.row_of(course_id) for course_id, *_ in top)
+    return [_annotate(course, *scores) for course, (_, *scores) in zip(records, top)], len(fused)
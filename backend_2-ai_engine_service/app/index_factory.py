@@ -0,0 +1,108 @@
+import math
+import faiss
+
+# Supported INDEX_TYPE values.  Every index is wrapped in IndexIDMap2 so
+# labels are stable course ids (see indexer.IndexSnapshot).
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw", "sq8", "sqfp16", "ivf_sq8")
+
+# Types whose vectors are partitioned into inverted lists and take nprobe.
+IVF_TYPES = ("ivf_flat", "ivf_pq", "ivf_sq8")
+
+# faiss k-means wants ~39 points per centroid; fewer still trains but warns.
+MIN_POINTS_PER_CENTROID = 39
+
+
+def index_config(settings):
+    """Requested index type and tuning parameters from settings."""
+    return {
+        "type": settings.INDEX_TYPE,
+        "nlist": settings.INDEX_NLIST,
+        "nprobe": settings.INDEX_NPROBE,
+        "pq_m": settings.INDEX_PQ_M,
+        "pq_nbits": settings.INDEX_PQ_NBITS,
+        "hnsw_m": settings.INDEX_HNSW_M,
+        "ef_construction": settings.INDEX_EF_CONSTRUCTION,
+        "ef_search": settings.INDEX_EF_SEARCH,
+    }
+
+
+def _effective_config(dim, n_total, n_train, config):
+    kind = config["type"]
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"Unknown INDEX_TYPE {kind!r}, expected one of {', '.join(INDEX_TYPES)}")
+    effective = dict(config)
+
+    if kind in IVF_TYPES:
+        nlist = config.get("nlist") or int(4 * math.sqrt(max(n_total, 1)))
+        effective["nlist"] = max(1, min(nlist, n_train // MIN_POINTS_PER_CENTROID))
+        if n_train < MIN_POINTS_PER_CENTROID:
+            # Too small to partition; a flat scan is exact and just as fast
+            # (over the same 8-bit codes for ivf_sq8).
+            effective.update(type="sq8" if kind == "ivf_sq8" else "flat", requested_type=kind)
+            return effective
+
+    if kind == "ivf_pq" and (n_train < 2 ** config["pq_nbits"] or dim % config["pq_m"]):
+        effective.update(type="ivf_flat", requested_type=kind)
+    return effective
+
+
+def _factory_key(config):
+    kind = config["type"]
+    if kind == "flat":
+        return "IDMap2,Flat"
+    if kind == "ivf_flat":
+        return f"IDMap2,IVF{config['nlist']},Flat"
+    if kind == "ivf_pq":
+        return f"IDMap2,IVF{config['nlist']},PQ{config['pq_m']}x{config['pq_nbits']}"
+    if kind == "sq8":
+        # IndexScalarQuantizer: one byte per dimension, trained per-dimension ranges.
+        return "IDMap2,SQ8"
+    if kind == "sqfp16":
+        return "IDMap2,SQfp16"
+    if kind == "ivf_sq8":
+        return f"IDMap2,IVF{config['nlist']},SQ8"
+    return f"IDMap2,HNSW{config['hnsw_m']}"
+
+
+def make_index(dim, train_vectors, config, n_total=None):
+    """
+    Create (and train, if needed) an empty ID-mapped index for `config`.
+    `n_total` is the number of vectors that will be added when only a sample
+    is passed for training.  Returns (index, effective_config); the effective
+    config records any parameter clamped or type downgraded because the
+    catalog is too small, and is what should be stored next to the index.
+    """
+    n_total = len(train_vectors) if n_total is None else n_total
+    effective = _effective_config(dim, n_total, len(train_vectors), config)
+    index = faiss.index_factory(dim, _factory_key(effective), faiss.METRIC_INNER_PRODUCT)
+    if effective["type"] == "hnsw":
+        faiss.downcast_index(index.index).hnsw.efConstruction = effective["ef_construction"]
+    if not index.is_trained:
+        index.train(train_vectors)
+    configure_search(index, effective)
+    return index, effective
+
+
+def configure_search(index, config):
+    """Apply the stored query-time parameters (nprobe / efSearch) to a loaded index."""
+    kind = config.get("type", "flat")
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap2) else index
+    if kind in IVF_TYPES:
+        faiss.extract_index_ivf(inner).nprobe = config["nprobe"]
+    elif kind == "hnsw":
+        inner.hnsw.efSearch = config["ef_search"]
+
+
+def search_parameters(config, selector):
+    """SearchParameters of the type the underlying index expects."""
+    kind = config.get("type", "flat")
+    if kind in IVF_TYPES:
+        return faiss.SearchParametersIVF(sel=selector, nprobe=config["nprobe"])
+    if kind == "hnsw":
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=config["ef_search"])
+    return faiss.SearchParameters(sel=selector)
+
+
+def supports_removal(config):
+    # HNSW graphs cannot drop vectors; such indexes are rebuilt from embeddings.
+    return config.get("type", "flat") != "hnsw"
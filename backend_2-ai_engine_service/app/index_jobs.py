@@ -0,0 +1,152 @@
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from .config import settings
+from .indexer import build_index, registry
+
+# Job status files live next to the versions so every worker sharing the
+# models volume can answer GET /admin/rebuild_index/{job_id}.
+JOBS_DIR = ".jobs"
+# Progress is written to disk at most this often; status changes always are.
+PERSIST_INTERVAL_SECONDS = 1.0
+_JOB_ID = re.compile(r"[0-9a-f]{32}")
+
+
+def _jobs_dir():
+    return os.path.join(settings.INDEX_VERSIONS_DIR, JOBS_DIR)
+
+
+class IndexRebuildJobs:
+    """
+    Runs build_index on a background thread and tracks its progress.
+    Only one rebuild runs per process; submitting while one is active
+    returns the active job.  Builds in different workers are serialised by
+    the build lock.  Job status is kept in memory and mirrored to a JSON
+    file per job under INDEX_VERSIONS_DIR, which get() and list() fall back
+    to for jobs started by other workers.
+    """
+
+    def __init__(self, max_history=20):
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+        self._active = None
+        self._persisted_at = {}
+        self.max_history = max_history
+
+    def submit(self):
+        with self._lock:
+            if self._active is not None:
+                return dict(self._jobs[self._active])
+
+            job_id = uuid.uuid4().hex
+            self._jobs[job_id] = {
+                'job_id': job_id,
+                'status': 'queued',
+                'progress': 0.0,
+                'processed': 0,
+                'total': None,
+                'previous_version': registry.version,
+                'version': None,
+                'error': None,
+                'created_at': datetime.utcnow().isoformat(),
+                'started_at': None,
+                'finished_at': None
+            }
+            self._active = job_id
+            while len(self._jobs) > self.max_history:
+                self._jobs.popitem(last=False)
+            job = dict(self._jobs[job_id])
+        self._persist(job)
+        self._prune_files()
+
+        thread = threading.Thread(target=self._run, args=(job_id,), name=f"index-rebuild-{job_id[:8]}", daemon=True)
+        thread.start()
+        return self.get(job_id)
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            self._jobs[job_id].update(fields)
+            job = dict(self._jobs[job_id])
+        if 'status' in fields or 'finished_at' in fields or \
+                time.monotonic() - self._persisted_at.get(job_id, 0.0) >= PERSIST_INTERVAL_SECONDS:
+            self._persist(job)
+
+    def _persist(self, job):
+        directory = _jobs_dir()
+        path = os.path.join(directory, job['job_id'] + ".json")
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            os.makedirs(directory, exist_ok=True)
+            with open(tmp_path, "w") as f:
+                json.dump(job, f)
+            os.replace(tmp_path, path)
+            self._persisted_at[job['job_id']] = time.monotonic()
+        except OSError as e:
+            print(f"Warning: failed to write rebuild job status {job['job_id']}: {e}")
+
+    def _read(self, job_id):
+        try:
+            with open(os.path.join(_jobs_dir(), job_id + ".json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _files(self):
+        try:
+            names = os.listdir(_jobs_dir())
+        except FileNotFoundError:
+            return []
+        return [name[:-5] for name in names if name.endswith(".json") and _JOB_ID.fullmatch(name[:-5])]
+
+    def _prune_files(self):
+        jobs = [job for job in (self._read(job_id) for job_id in self._files()) if job]
+        jobs.sort(key=lambda job: job.get('created_at') or '')
+        for job in jobs[:max(len(jobs) - self.max_history, 0)]:
+            try:
+                os.remove(os.path.join(_jobs_dir(), job['job_id'] + ".json"))
+            except OSError:
+                pass
+
+    def _run(self, job_id):
+        self._update(job_id, status='running', started_at=datetime.utcnow().isoformat())
+
+        def progress(processed, total):
+            # Embedding dominates build time; writing and swapping is the last 5%.
+            self._update(job_id, processed=processed, total=total, progress=round(0.95 * processed / max(total, 1), 3))
+
+        try:
+            snapshot = build_index(rebuild=True, progress=progress)
+            self._update(job_id, status='succeeded', progress=1.0, processed=snapshot.ntotal, total=snapshot.ntotal, version=snapshot.version)
+        except Exception as e:
+            print(f"Index rebuild {job_id} failed: {e}")
+            self._update(job_id, status='failed', error=str(e))
+        finally:
+            self._update(job_id, finished_at=datetime.utcnow().isoformat())
+            with self._lock:
+                self._active = None
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job:
+                return dict(job)
+        return self._read(job_id) if _JOB_ID.fullmatch(job_id) else None
+
+    def list(self):
+        with self._lock:
+            jobs = {job_id: dict(job) for job_id, job in self._jobs.items()}
+        for job_id in self._files():
+            if job_id not in jobs:
+                job = self._read(job_id)
+                if job:
+                    jobs[job_id] = job
+        ordered = sorted(jobs.values(), key=lambda job: job.get('created_at') or '', reverse=True)
+        return ordered[:self.max_history]
+
+
+rebuild_jobs = IndexRebuildJobs()
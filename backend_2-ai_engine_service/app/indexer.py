@@ -2,36 +2,508 @@ import faiss
 import numpy as np
 import pickle
 import os
+import json
+import hashlib
+import shutil
+import fcntl
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
 from .config import settings
 from .catalog import load_catalog
 from .embeddings import embed_texts
-from typing import Tuple
-
-def build_index(rebuild: bool = False) -> Tuple[faiss.IndexFlatIP, list]:
-    df = load_catalog(settings.NSQF_COURSES_PATH)
-    texts = (df['title'] + ". " + df['description'] + " Skills: " + df['skills'] + " Keywords: " + df['keywords']).tolist()
-    embeds = embed_texts(texts)
-    
-    os.makedirs(os.path.dirname(settings.EMBEDS_PATH) if os.path.dirname(settings.EMBEDS_PATH) else "./models", exist_ok=True)
-    np.save(settings.EMBEDS_PATH, embeds)
-    
-    meta = df.to_dict(orient='records')
-    os.makedirs(os.path.dirname(settings.META_PATH) if os.path.dirname(settings.META_PATH) else "./models", exist_ok=True)
-    with open(settings.META_PATH, "wb") as f:
-        pickle.dump(meta, f)
-
-    dim = embeds.shape[1]
-    index = faiss.IndexFlatIP(dim)
-    index.add(embeds)
-    
-    os.makedirs(os.path.dirname(settings.INDEX_PATH) if os.path.dirname(settings.INDEX_PATH) else "./models", exist_ok=True)
-    faiss.write_index(index, settings.INDEX_PATH)
-    return index, meta
-
-def load_index() -> Tuple[faiss.IndexFlatIP, list]:
-    if not os.path.exists(settings.INDEX_PATH):
-        return build_index()
+from .columnar import ColumnarMeta, save_columns
+from .filters import AttributeBitmaps
+from .reranker import ColumnarReranker
+from .index_factory import index_config, make_index, configure_search, search_parameters, supports_removal
+from typing import Callable, Optional, Tuple
+
+# Each build is written to INDEX_VERSIONS_DIR/<version>/ and only becomes
+# visible once INDEX_VERSION_PATH is atomically repointed at it.  Version
+# directories are never modified after the pointer swap, which is what
+# makes it safe for every worker to memory-map them (see _read_artifacts).
+INDEX_FILE = os.path.basename(settings.INDEX_PATH)
+EMBEDS_FILE = os.path.basename(settings.EMBEDS_PATH)
+META_FILE = os.path.basename(settings.META_PATH)
+IDS_FILE = "course_ids.npy"
+HASHES_FILE = "content_hashes.npy"
+MANIFEST_FILE = "manifest.json"
+META_DIR = "meta"
+
+# course_embeds.npy storage; float16 halves it (the vectors are only reused
+# for incremental builds and, when float32, searched by flat versions).
+EMBEDS_DTYPES = ("float32", "float16")
+
+# Query rows per block in IndexSnapshot._scan are chosen so one block of
+# scores stays around this many floats.
+SCAN_BLOCK_SCORES = 1 << 22
+
+
+def _course_texts(df):
+    return (df['title'] + ". " + df['description'] + " Skills: " + df['skills'] + " Keywords: " + df['keywords']).tolist()
+
+
+def _embed_in_batches(texts, progress=None):
+    batch_size = settings.INDEX_BUILD_BATCH_SIZE
+    chunks = []
+    for start in range(0, len(texts), batch_size):
+        chunks.append(embed_texts(texts[start:start + batch_size], use_cache=False))
+        if progress:
+            progress(min(start + batch_size, len(texts)), len(texts))
+    return np.vstack(chunks) if chunks else np.zeros((0, 0), dtype=np.float32)
+
+
+@contextmanager
+def _build_lock():
+    # Serialises builds across uvicorn workers sharing the models volume.
+    os.makedirs(settings.INDEX_VERSIONS_DIR, exist_ok=True)
+    with open(os.path.join(settings.INDEX_VERSIONS_DIR, ".build.lock"), "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _content_hash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def _embeds_dtype():
+    if settings.INDEX_EMBEDS_DTYPE not in EMBEDS_DTYPES:
+        raise ValueError(f"Unknown INDEX_EMBEDS_DTYPE {settings.INDEX_EMBEDS_DTYPE!r}, expected one of {', '.join(EMBEDS_DTYPES)}")
+    return np.dtype(settings.INDEX_EMBEDS_DTYPE)
+
+
+def _load_previous_version():
+    """Artifacts of the published version, or None if they cannot be reused."""
+    version = _read_current_version()
+    if not version:
+        return None
+    version_dir = os.path.join(settings.INDEX_VERSIONS_DIR, version)
+    try:
+        with open(os.path.join(version_dir, MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+        if manifest.get("embedding_model") != settings.EMBEDDING_MODEL:
+            return None
+        ids = np.load(os.path.join(version_dir, IDS_FILE))
+        hashes = np.load(os.path.join(version_dir, HASHES_FILE))
+        embeds = np.load(os.path.join(version_dir, EMBEDS_FILE), mmap_mode="r")
+        meta = _read_meta(version_dir)
+        # Read into memory (not mapped): the upsert below modifies it.
+        index = faiss.read_index(os.path.join(version_dir, INDEX_FILE))
+    except (FileNotFoundError, KeyError, ValueError) as e:
+        print(f"Warning: previous index {version} not reusable, doing a full build: {e}")
+        return None
+    return {
+        "version": version,
+        "index": index,
+        "index_config": manifest.get("index", {"type": "flat"}),
+        "index_requested": manifest.get("index_requested"),
+        "embeds": embeds,
+        "positions": {str(m.get('course_id')): pos for pos, m in enumerate(meta)},
+        "ids": ids,
+        "hashes": hashes,
+    }
+
+
+def build_index(rebuild: bool = False, progress: Optional[Callable[[int, int], None]] = None) -> "IndexSnapshot":
+    """
+    Build and publish a new index version; returns the published snapshot.
+
+    Course vectors are keyed by a stable int64 id per course_id.  Rows whose
+    indexed text hashes the same as in the published version reuse its
+    embedding; only new or changed rows go through embed_texts, and the
+    previous FAISS index is updated with remove_ids/add_with_ids.
+    """
+    with _build_lock():
+        if not rebuild and _artifact_signature() is not None:
+            # Another worker finished a build while we waited for the lock.
+            # Hand back the snapshot: reading .index would load a private copy
+            # of a memory-mapped flat version.
+            return registry.get()
+        embeds_dtype = _embeds_dtype()
+        df = load_catalog(settings.NSQF_COURSES_PATH)
+        texts = _course_texts(df)
+        hashes = np.array([_content_hash(t) for t in texts], dtype="S40")
+        course_ids = df['course_id'].tolist()
+        meta = df.to_dict(orient='records')
+        previous = _load_previous_version()
+
+        ids = np.empty(len(course_ids), dtype=np.int64)
+        reused_from = np.full(len(course_ids), -1, dtype=np.int64)
+        next_id = int(previous["ids"].max()) + 1 if previous is not None and len(previous["ids"]) else 0
+        seen = set()
+        for pos, course_id in enumerate(course_ids):
+            prev_pos = previous["positions"].get(course_id) if previous is not None else None
+            if prev_pos is not None and course_id not in seen:
+                ids[pos] = previous["ids"][prev_pos]
+                if previous["hashes"][prev_pos] == hashes[pos]:
+                    reused_from[pos] = prev_pos
+            else:
+                ids[pos] = next_id
+                next_id += 1
+            seen.add(course_id)
+
+        stale = np.flatnonzero(reused_from < 0)
+        fresh = _embed_in_batches([texts[i] for i in stale], progress)
+        if previous is not None:
+            dim = previous["embeds"].shape[1]
+        else:
+            dim = fresh.shape[1] if len(stale) else 0
+        embeds = np.empty((len(course_ids), dim), dtype=np.float32)
+        reused = np.flatnonzero(reused_from >= 0)
+        if len(reused):
+            embeds[reused] = previous["embeds"][reused_from[reused]]
+        if len(stale):
+            embeds[stale] = fresh
+
+        requested = index_config(settings)
+        removed = int((~np.isin(previous["ids"], ids)).sum()) if previous is not None else 0
+        if (
+            previous is not None
+            and isinstance(previous["index"], faiss.IndexIDMap2)
+            and previous["index_requested"] == requested
+            and supports_removal(previous["index_config"])
+            and "requested_type" not in previous["index_config"]
+        ):
+            # Upsert: drop vectors of removed and changed courses, add the re-embedded ones.
+            index, effective = previous["index"], previous["index_config"]
+            keep = np.isin(previous["ids"], ids[reused])
+            index.remove_ids(previous["ids"][~keep])
+            if len(stale):
+                index.add_with_ids(embeds[stale], ids[stale])
+        else:
+            # New index type/parameters, HNSW (which cannot remove vectors) or a
+            # catalog that was too small for the requested type last time:
+            # train and fill a fresh index from the (mostly reused) embeddings.
+            index, effective = make_index(dim, embeds, requested)
+            if len(ids):
+                index.add_with_ids(embeds, ids)
+
+        version = "v" + datetime.utcnow().strftime("%Y%m%d%H%M%S%f")
+        staging_dir = os.path.join(settings.INDEX_VERSIONS_DIR, f".{version}.tmp")
+        os.makedirs(staging_dir)
+        np.save(os.path.join(staging_dir, EMBEDS_FILE), embeds.astype(embeds_dtype, copy=False))
+        np.save(os.path.join(staging_dir, IDS_FILE), ids)
+        np.save(os.path.join(staging_dir, HASHES_FILE), hashes)
+        save_columns(os.path.join(staging_dir, META_DIR), df)
+        # Still written for workers running code that predates META_DIR.
+        with open(os.path.join(staging_dir, META_FILE), "wb") as f:
+            pickle.dump(meta, f)
+        faiss.write_index(index, os.path.join(staging_dir, INDEX_FILE))
+        with open(os.path.join(staging_dir, MANIFEST_FILE), "w") as f:
+            json.dump({
+                "version": version,
+                "embedding_model": settings.EMBEDDING_MODEL,
+                "dim": int(dim),
+                "count": len(meta),
+                "base_version": previous["version"] if previous is not None else None,
+                "embedded": int(len(stale)),
+                "reused": int(len(reused)),
+                "removed": removed,
+                "index": effective,
+                "index_requested": requested,
+                "embeds_dtype": settings.INDEX_EMBEDS_DTYPE,
+                "created_at": datetime.utcnow().isoformat(),
+            }, f)
+        os.rename(staging_dir, os.path.join(settings.INDEX_VERSIONS_DIR, version))
+
+        # Serve the files just written rather than the objects built here, so
+        # this worker maps the same pages as every other one.  The pointer is
+        # flipped under the registry lock so requests in this process never
+        # see the new version before it is installed; other workers keep
+        # serving their old copy until they have loaded this one.
+        snapshot = _read_artifacts(version)
+        with registry.lock:
+            _write_current_version(version)
+            registry.publish(snapshot)
+        _prune_versions(keep=version)
+    return snapshot
+
+
+def _write_current_version(version):
+    os.makedirs(os.path.dirname(settings.INDEX_VERSION_PATH) or "./models", exist_ok=True)
+    tmp_path = settings.INDEX_VERSION_PATH + ".tmp"
+    with open(tmp_path, "w") as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, settings.INDEX_VERSION_PATH)
+
+
+def _read_current_version():
+    try:
+        with open(settings.INDEX_VERSION_PATH) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def list_versions():
+    if not os.path.isdir(settings.INDEX_VERSIONS_DIR):
+        return []
+    return sorted(
+        name for name in os.listdir(settings.INDEX_VERSIONS_DIR)
+        if not name.startswith(".") and os.path.isdir(os.path.join(settings.INDEX_VERSIONS_DIR, name))
+    )
+
+
+def _prune_versions(keep):
+    versions = [v for v in list_versions() if v != keep]
+    stale = versions[:max(len(versions) - (settings.INDEX_KEEP_VERSIONS - 1), 0)]
+    for version in stale:
+        shutil.rmtree(os.path.join(settings.INDEX_VERSIONS_DIR, version), ignore_errors=True)
+
+
+def _artifact_signature():
+    """
+    Current version name, or mtime/size of the legacy flat artifacts when no
+    version has been published yet.  None if there is nothing to load.
+    """
+    version = _read_current_version()
+    if version:
+        return version
+    signature = []
+    for path in (settings.INDEX_PATH, settings.META_PATH):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        signature.append((st.st_mtime_ns, st.st_size))
+    return tuple(signature)
+
+
+def _read_meta(version_dir):
+    """Course metadata of a version: memory-mapped columns, or the pickle for older versions."""
+    if os.path.isdir(os.path.join(version_dir, META_DIR)):
+        return ColumnarMeta(os.path.join(version_dir, META_DIR), mmap=settings.INDEX_MMAP)
+    with open(os.path.join(version_dir, META_FILE), "rb") as f:
+        return pickle.load(f)
+
+
+def _read_index(path):
+    if settings.INDEX_MMAP:
+        return faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    return faiss.read_index(path)
+
+
+def _read_artifacts(signature):
+    """
+    Load a published version.  With INDEX_MMAP the embeddings, ids and
+    metadata columns are read-only memory maps shared by all workers, and
+    the FAISS index is opened with IO_FLAG_MMAP (which maps IVF inverted
+    lists; faiss still copies flat/HNSW storage, so flat versions are
+    searched over the mapped embeddings instead and never read the index).
+    """
+    if isinstance(signature, str):
+        version_dir = os.path.join(settings.INDEX_VERSIONS_DIR, signature)
+        with open(os.path.join(version_dir, MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+        mode = "r" if settings.INDEX_MMAP else None
+        ids = np.load(os.path.join(version_dir, IDS_FILE), mmap_mode=mode)
+        meta = _read_meta(version_dir)
+        config = manifest.get("index") or {"type": "flat"}
+        index_path = os.path.join(version_dir, INDEX_FILE)
+        if settings.INDEX_MMAP and config.get("type") == "flat":
+            embeds = np.load(os.path.join(version_dir, EMBEDS_FILE), mmap_mode="r")
+            if embeds.dtype == np.float32:
+                return IndexSnapshot(None, meta, ids, signature, config, embeds=embeds, index_path=index_path)
+        return IndexSnapshot(_read_index(index_path), meta, ids, signature, config)
     index = faiss.read_index(settings.INDEX_PATH)
     with open(settings.META_PATH, "rb") as f:
         meta = pickle.load(f)
-    return index, meta
+    return IndexSnapshot(index, meta)
+
+
+class IndexSnapshot:
+    """
+    One loaded index version.  FAISS labels are stable course ids; search()
+    translates them to positions in `meta`.  Legacy flat artifacts have no
+    id map and their labels already are positions.
+
+    A flat version can instead be given its (memory-mapped) `embeds`, whose
+    rows are in meta order; search() then scans them directly and the
+    FAISS index is only read from `index_path` if something asks for it.
+    """
+
+    def __init__(self, index, meta, ids=None, version=None, config=None, embeds=None, index_path=None):
+        self._index = index
+        self._index_path = index_path
+        self._index_lock = threading.Lock()
+        self.meta = meta
+        self.config = config or {"type": "flat"}
+        if index is not None:
+            configure_search(index, self.config)
+        self.vectors = np.asarray(embeds) if embeds is not None else None
+        self.dim = self.vectors.shape[1] if self.vectors is not None else index.d
+        self.ids = ids if ids is not None else np.arange(len(meta), dtype=np.int64)
+        self.version = version
+        self.bitmaps = AttributeBitmaps(meta)
+        self.reranker = ColumnarReranker(meta)
+        self._pos_of_course = {}
+        for pos, course in enumerate(meta):
+            self._pos_of_course.setdefault(str(course.get('course_id')), pos)
+        self._pos_of_id = None
+        if ids is not None:
+            self._pos_of_id = np.full(int(ids.max()) + 1 if len(ids) else 0, -1, dtype=np.int64)
+            self._pos_of_id[ids] = np.arange(len(ids))
+
+    def position_of(self, course_id):
+        """Position of `course_id` in meta, or None."""
+        return self._pos_of_course.get(str(course_id))
+
+    def course(self, course_id):
+        pos = self.position_of(course_id)
+        return None if pos is None else self.meta[pos]
+
+    @property
+    def index(self):
+        if self._index is None:
+            with self._index_lock:
+                if self._index is None:
+                    index = _read_index(self._index_path)
+                    configure_search(index, self.config)
+                    self._index = index
+        return self._index
+
+    @property
+    def mapped(self):
+        return self.vectors is not None or isinstance(self.meta, ColumnarMeta)
+
+    @property
+    def ntotal(self):
+        return len(self.ids)
+
+    def filter_mask(self, filters):
+        """Mask of meta positions passing `filters` (None when unfiltered)."""
+        return self.bitmaps.mask(filters)
+
+    def _selector(self, mask):
+        # Bitmap over FAISS ids: bit i is set when the course with id i passes.
+        id_mask = np.zeros(int(self.ids.max()) + 1 if len(self.ids) else 0, dtype=bool)
+        id_mask[self.ids[mask]] = True
+        bitmap = np.packbits(id_mask, bitorder='little')
+        return faiss.IDSelectorBitmap(bitmap), bitmap
+
+    def search(self, queries, k, mask=None):
+        """
+        Return (scores, positions) with -1 positions for empty slots.
+        When `mask` is given only those positions are searched, so up to k
+        results come back however selective the filter is.
+        """
+        queries = np.ascontiguousarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        allowed = self.ntotal if mask is None else int(mask.sum())
+        k = min(k, allowed)
+        if k <= 0:
+            return np.zeros((len(queries), 0), dtype=np.float32), np.zeros((len(queries), 0), dtype=np.int64)
+        if self.vectors is not None:
+            return self._scan(queries, k, mask)
+        if mask is None:
+            scores, labels = self.index.search(queries, k)
+        else:
+            selector, bitmap = self._selector(mask)
+            scores, labels = self.index.search(queries, k, params=search_parameters(self.config, selector))
+        if self._pos_of_id is None:
+            return scores, labels
+        positions = np.where(labels >= 0, self._pos_of_id[np.maximum(labels, 0)], -1)
+        return scores, positions
+
+    def _scan(self, queries, k, mask):
+        """Exact inner-product top-k over the embeddings, what IndexFlatIP would return."""
+        scores = np.empty((len(queries), k), dtype=np.float32)
+        positions = np.empty((len(queries), k), dtype=np.int64)
+        step = max(1, SCAN_BLOCK_SCORES // max(len(self.vectors), 1))
+        for start in range(0, len(queries), step):
+            block = queries[start:start + step] @ self.vectors.T
+            if mask is not None:
+                block[:, ~mask] = -np.inf
+            top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+            top_scores = np.take_along_axis(block, top, axis=1)
+            order = np.argsort(-top_scores, axis=1, kind="stable")
+            positions[start:start + step] = np.take_along_axis(top, order, axis=1)
+            scores[start:start + step] = np.take_along_axis(top_scores, order, axis=1)
+        return scores, positions
+
+
+class IndexRegistry:
+    """
+    Process-wide holder for the FAISS index and course metadata.
+    Artifacts are read from disk once and re-read only when the published
+    version (or, for legacy flat artifacts, their mtime/size) changes.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self._current = None
+        self._signature = None
+        self._checked_at = 0.0
+        self.loads = 0
+
+    def get(self) -> "IndexSnapshot":
+        current = self._current
+        if current is not None and time.monotonic() - self._checked_at < settings.INDEX_RELOAD_CHECK_SECONDS:
+            return current
+
+        with self.lock:
+            signature = _artifact_signature()
+            self._checked_at = time.monotonic()
+            if signature is not None and signature != self._signature:
+                try:
+                    loaded = _read_artifacts(signature)
+                except Exception as e:
+                    # Keep answering from the version already in memory.
+                    if self._current is None:
+                        raise
+                    print(f"Warning: failed to load index {signature}: {e}")
+                    return self._current
+                self._current, self._signature = loaded, signature
+                self.loads += 1
+            if self._current is not None:
+                return self._current
+        # Nothing has been built yet.  Build outside the registry lock since
+        # build_index publishes into the registry itself.
+        build_index()
+        return self._current
+
+    def publish(self, snapshot):
+        """Install a freshly built snapshot without re-reading it from disk."""
+        with self.lock:
+            self._current = snapshot
+            self._signature = snapshot.version
+            self._checked_at = time.monotonic()
+            self.loads += 1
+
+    @property
+    def version(self):
+        return self._signature if isinstance(self._signature, str) else None
+
+    def stats(self):
+        current = self._current
+        return {
+            "loaded": current is not None,
+            "courses": len(current.meta) if current is not None else 0,
+            "loads": self.loads,
+            "version": self.version,
+            "index_type": current.config.get("type") if current is not None else None,
+            "mmap": current.mapped if current is not None else False,
+        }
+
+
+registry = IndexRegistry()
+
+
+def get_snapshot() -> IndexSnapshot:
+    return registry.get()
+
+
+def load_index() -> Tuple[faiss.Index, list]:
+    """
+    (index, meta) of the current version.  Labels returned by index.search
+    are course ids, not meta positions; use get_snapshot().search instead.
+    For flat versions served from the mapped embeddings this reads the FAISS
+    file into this process, so service code should not call it.
+    """
+    snapshot = registry.get()
+    return snapshot.index, snapshot.meta
@@ -4,14 +4,13 @@ from sklearn.preprocessing import StandardScaler
 import joblib
 import os
 from .catalog import load_catalog
-from .embeddings import embed_texts
-from .indexer import load_index
+from .user_embeddings import embed_profiles
+from .indexer import get_snapshot
 from .config import settings
 
 class LearnerCourseMatcher:
     def __init__(self):
-        self.index = None
-        self.meta = None
+        self.snapshot = None
         self.scaler = StandardScaler()
         self.is_ready = False
         
@@ -20,7 +19,7 @@ class LearnerCourseMatcher:
         
         # Load FAISS index and metadata
         try:
-            self.index, self.meta = load_index()
+            self.snapshot = get_snapshot()
             self.is_ready = True
         except Exception as e:
             print(f"Warning: Failed to load FAISS index: {e}")
@@ -46,67 +45,46 @@ class LearnerCourseMatcher:
             
         return ". ".join(text_parts) if text_parts else "learning courses"
 
-    def match_courses(self, profile, courses=None, top_k=10):
+    def match_courses(self, profile, courses=None, top_k=10, filters=None):
         """
         Match courses to a learner profile using Semantic Search (FAISS) + Reranking.
-        If `courses` is provided, we filter/rank those. If None, we search the global index.
+        `filters` (nsqf_level, region, language, max_duration_months, min_nsqf_level)
+        are applied inside the FAISS search. `courses` is accepted for backwards
+        compatibility and ignored.
         """
-        if not self.is_ready:
-            # Try reloading if not ready
-            try:
-                self.index, self.meta = load_index()
-                self.is_ready = True
-            except:
-                return []
+        # The registry only touches disk when the artifacts change, so this
+        # also picks up rebuilt indexes without restarting the worker.
+        try:
+            self.snapshot = get_snapshot()
+            self.is_ready = True
+        except:
+            return []
         
         # 1. Semantic Retrieval using FAISS
         query_text = self._profile_to_text(profile)
-        query_embedding = embed_texts([query_text])
+        query_embedding = embed_profiles("learner", [profile.get('user_id')], [query_text])
         
         # Search efficiently using FAISS
-        scores, indices = self.index.search(query_embedding, top_k * 3) # Fetch more candidates for reranking
+        mask = self.snapshot.filter_mask(filters)
+        scores, indices = self.snapshot.search(query_embedding, top_k * 3, mask=mask) # Fetch more candidates for reranking
         
-        candidates = []
-        for score, idx in zip(scores[0], indices[0]):
-            if idx < len(self.meta):
-                course = self.meta[idx]
-                candidates.append({
-                    **course,
-                    'semantic_score': float(score)  # Cosine similarity
-                })
+        valid = (indices[0] >= 0) & (indices[0] < len(self.snapshot.meta))
+        positions = indices[0][valid]
+        semantic = scores[0][valid]
         
-        # 2. Reranking / Filtering
-        results = []
-        user_level = profile.get('preferred_nsqf_level', 1)
-        user_lang = profile.get('preferred_language', '').lower()
-        user_region = profile.get('region', '').lower()
+        # 2. Reranking: NSQF level, language and region boosts plus skill
+        # overlap for every candidate in one vectorized pass
+        final_scores, skill_match, level_diff = self.snapshot.reranker.compose_learner(profile, semantic, positions)
+        course_match = self.snapshot.reranker.match_probability[positions]
+        match_probability = [round(float(s * m), 3) for s, m in zip(skill_match, course_match)]
         
-        for course in candidates:
-            # Base score from semantic match
-            final_score = course['semantic_score'] * 0.7
-            
-            # NSQF Level alignment (higher score if level is close)
-            # We assume users want courses near their level, not too easy or too hard
-            course_level = course.get('nsqf_level', 1)
-            level_diff = abs(user_level - course_level)
-            if level_diff == 0:
-                final_score += 0.15
-            elif level_diff <= 1:
-                final_score += 0.1
-            elif level_diff <= 2:
-                final_score += 0.05
-                
-            # Language Match
-            if user_lang and user_lang in course.get('language', '').lower():
-                final_score += 0.1
-                
-            # Region Preference (if course has specific region)
-            course_region = course.get('region', '').lower()
-            if user_region and course_region and user_region == course_region:
-                final_score += 0.05
-            
-            predictions = self._calculate_predictions(profile, course)
-            
+        # Sort by match probability (stable, like list.sort)
+        order = np.argsort(-np.array(match_probability), kind='stable')[:top_k]
+        
+        results = []
+        for i in order:
+            course = self.snapshot.meta[positions[i]]
+            predictions = self._predictions(float(skill_match[i]), float(level_diff[i]), float(course_match[i]))
             results.append({
                 'course_id': course.get('course_id'),
                 'title': course.get('title'),
@@ -123,12 +101,9 @@ class LearnerCourseMatcher:
                 'engagement_probability': predictions['engagement_probability'],
                 'combined_score': predictions['combined_score'],
                 'predictions': predictions,
-                'tags': ['Recommended'] if final_score > 0.8 else []
+                'tags': ['Recommended'] if final_scores[i] > 0.8 else []
             })
-            
-        # Sort by final score
-        results.sort(key=lambda x: x['match_probability'], reverse=True)
-        return results[:top_k]
+        return results
 
     def _calculate_predictions(self, profile, course):
         """Calculate ML predictions for completion, performance, and engagement"""
@@ -139,7 +114,12 @@ class LearnerCourseMatcher:
             if user_skills & course_skills:
                 skill_match = min(0.95, 0.5 + len(user_skills & course_skills) * 0.15)
         
-        level_diff = abs(profile.get('preferred_nsqf_level', 4) - course.get('nsqf_level', 4))
+        preferred = profile.get('preferred_nsqf_level')
+        level_diff = abs((4 if preferred is None else preferred) - course.get('nsqf_level', 4))
+        return self._predictions(skill_match, level_diff, course.get('match_probability', 0.5))
+
+    @staticmethod
+    def _predictions(skill_match, level_diff, course_match_probability):
         if level_diff == 0:
             completion_pred = 0.85
             performance_pred = 0.80
@@ -153,7 +133,7 @@ class LearnerCourseMatcher:
         engagement_pred = 0.6 + (skill_match * 0.3)
         
         return {
-            'match_probability': round(skill_match * course.get('match_probability', 0.5), 3),
+            'match_probability': round(skill_match * course_match_probability, 3),
             'completion_probability': round(completion_pred, 3),
             'performance_probability': round(performance_pred, 3),
             'engagement_probability': round(min(engagement_pred, 0.95), 3),
@@ -7,6 +7,27 @@ import joblib
 import os
 from datetime import datetime, timedelta
 from collections import deque
+from .event_features import event_stats
+from .session_store import session_store
+
+
+class SessionContext:
+    """
+    One session's features, extracted once and, on first use, vectorized
+    and scaled once, so all of LearnerMonitor's detectors share them.
+    """
+    
+    def __init__(self, monitor, events):
+        self.monitor = monitor
+        self.features = monitor._extract_session_features(events)
+        self._X_scaled = None
+    
+    @property
+    def X_scaled(self):
+        if self._X_scaled is None:
+            X = self.monitor._features_to_vector(self.features).reshape(1, -1)
+            self._X_scaled = self.monitor.scaler.transform(X)
+        return self._X_scaled
 
 
 class LearnerMonitor:
@@ -20,7 +41,6 @@ class LearnerMonitor:
         self.models_dir = 'models'
         os.makedirs(self.models_dir, exist_ok=True)
         
-        self.session_windows = {}
         self.alert_thresholds = {
             'inactive_hours': 2.0,
             'struggle_score': 0.7,
@@ -29,20 +49,15 @@ class LearnerMonitor:
         }
     
     def _extract_session_features(self, events):
-        if not events or len(events) == 0:
+        if events is None or len(events) == 0:
             return None
-        
-        df = pd.DataFrame(events)
-        
-        if 'timestamp' in df.columns:
-            df['timestamp'] = pd.to_datetime(df['timestamp'])
-            df = df.sort_values('timestamp')
+        stats = event_stats(events)
         
         features = {}
         
-        features['total_events'] = len(events)
+        features['total_events'] = stats.count
         
-        event_types = df['event_type'].value_counts() if 'event_type' in df.columns else pd.Series()
+        event_types = stats.event_types
         features['page_views'] = event_types.get('page_view', 0)
         features['clicks'] = event_types.get('click', 0)
         features['scrolls'] = event_types.get('scroll', 0)
@@ -57,19 +72,12 @@ class LearnerMonitor:
         features['searches'] = event_types.get('search', 0)
         features['repeats'] = event_types.get('content_repeat', 0)
         
-        if 'timestamp' in df.columns and len(df) > 1:
-            session_start = df['timestamp'].min()
-            session_end = df['timestamp'].max()
-            session_duration = (session_end - session_start).total_seconds() / 3600
-            features['session_duration_hours'] = session_duration
-            
-            time_diffs = df['timestamp'].diff().dt.total_seconds().dropna()
-            features['avg_time_between_events'] = time_diffs.mean() if len(time_diffs) > 0 else 0
-            features['max_gap_hours'] = time_diffs.max() / 3600 if len(time_diffs) > 0 else 0
-            
-            inactive_periods = time_diffs[time_diffs > 300]
-            features['long_inactive_periods'] = len(inactive_periods)
-            features['total_inactive_seconds'] = inactive_periods.sum() if len(inactive_periods) > 0 else 0
+        if 'timestamp' in stats.fields and stats.count > 1:
+            features['session_duration_hours'] = stats.duration_seconds / 3600
+            features['avg_time_between_events'] = stats.mean_gap_seconds
+            features['max_gap_hours'] = stats.max_gap_seconds / 3600
+            features['long_inactive_periods'] = stats.long_gaps
+            features['total_inactive_seconds'] = stats.long_gap_seconds
         else:
             features['session_duration_hours'] = 0
             features['avg_time_between_events'] = 0
@@ -83,16 +91,12 @@ class LearnerMonitor:
         engagement_negative = features['tab_switches'] + features['timeouts'] + features['quiz_fails']
         features['engagement_ratio'] = engagement_positive / max(engagement_positive + engagement_negative, 1)
         
-        features['scroll_depth_avg'] = df['scroll_depth'].mean() if 'scroll_depth' in df.columns else 0
+        features['scroll_depth_avg'] = stats.scroll_depth_mean if 'scroll_depth' in stats.fields else 0
         features['video_watch_ratio'] = features['video_plays'] / max(features['video_completes'], 1)
         
-        features['content_diversity'] = df['content_id'].nunique() if 'content_id' in df.columns else 1
+        features['content_diversity'] = len(stats.content_ids) if 'content_id' in stats.fields else 1
         
-        if 'content_type' in df.columns:
-            content_types = df['content_type'].value_counts()
-            features['content_type_mode'] = content_types.idxmax() if len(content_types) > 0 else 'unknown'
-        else:
-            features['content_type_mode'] = 'unknown'
+        features['content_type_mode'] = stats.most_common_content_type('unknown')
         
         return features
     
@@ -179,34 +183,35 @@ class LearnerMonitor:
         self.is_trained = True
         return self
     
-    def detect_anomaly(self, events):
+    def session_context(self, events):
+        """Features of `events` for the detectors; pass it as `context` to avoid re-extracting."""
         if not self.is_trained:
             self.train()
-        
-        features = self._extract_session_features(events)
+        return SessionContext(self, events)
+    
+    def detect_anomaly(self, events, context=None):
+        context = context or self.session_context(events)
+        features = context.features
         if features is None:
             return {'is_anomaly': False, 'anomaly_score': 0, 'alert_type': 'none'}
         
-        X = self._features_to_vector(features).reshape(1, -1)
-        X_scaled = self.scaler.transform(X)
-        
-        is_anomaly = self.anomaly_model.predict(X_scaled)[0] == -1
-        anomaly_score = abs(self.anomaly_model.score_samples(X_scaled)[0])
+        # One pass over the forest: predict() is score_samples() - offset_ < 0.
+        score = self.anomaly_model.score_samples(context.X_scaled)[0]
+        is_anomaly = score - self.anomaly_model.offset_ < 0
+        anomaly_score = abs(score)
         
         return {
             'is_anomaly': bool(is_anomaly),
             'anomaly_score': round(float(anomaly_score), 3)
         }
     
-    def detect_boredom(self, events):
-        features = self._extract_session_features(events)
+    def detect_boredom(self, events, context=None):
+        context = context or self.session_context(events)
+        features = context.features
         if features is None:
             return {'boredom_probability': 0, 'is_bored': False, 'signals': []}
         
-        X = self._features_to_vector(features).reshape(1, -1)
-        X_scaled = self.scaler.transform(X)
-        
-        boredom_prob = self.boredom_model.predict(X_scaled)[0]
+        boredom_prob = self.boredom_model.predict(context.X_scaled)[0]
         boredom_prob = max(0, min(1, boredom_prob))
         
         signals = []
@@ -225,8 +230,9 @@ class LearnerMonitor:
             'signals': signals
         }
     
-    def detect_inactivity(self, events):
-        features = self._extract_session_features(events)
+    def detect_inactivity(self, events, context=None):
+        context = context or self.session_context(events)
+        features = context.features
         if features is None:
             return {'inactive_hours': 0, 'is_inactive': False, 'signals': []}
         
@@ -245,15 +251,13 @@ class LearnerMonitor:
             'signals': signals
         }
     
-    def detect_struggle(self, events):
-        features = self._extract_session_features(events)
+    def detect_struggle(self, events, context=None):
+        context = context or self.session_context(events)
+        features = context.features
         if features is None:
             return {'struggle_probability': 0, 'is_struggling': False, 'signals': []}
         
-        X = self._features_to_vector(features).reshape(1, -1)
-        X_scaled = self.scaler.transform(X)
-        
-        struggle_prob = self.struggle_model.predict(X_scaled)[0]
+        struggle_prob = self.struggle_model.predict(context.X_scaled)[0]
         struggle_prob = max(0, min(1, struggle_prob))
         
         signals = []
@@ -274,8 +278,9 @@ class LearnerMonitor:
             'signals': signals
         }
     
-    def detect_fast_completion(self, events):
-        features = self._extract_session_features(events)
+    def detect_fast_completion(self, events, context=None):
+        context = context or self.session_context(events)
+        features = context.features
         if features is None:
             return {'is_suspicious': False, 'completion_speed_hours': 0, 'signals': []}
         
@@ -309,15 +314,21 @@ class LearnerMonitor:
             'signals': signals
         }
     
-    def analyze_session(self, events, user_id=None):
+    def analyze_session(self, events, user_id=None, context=None):
+        """
+        Alerts and detector results for a session.  With a user_id the
+        session's aggregates are kept so append_events can continue it.
+        """
         if user_id:
-            self.session_windows[user_id] = events
+            events = event_stats(events)
+            session_store.replace(user_id, events)
         
-        anomaly = self.detect_anomaly(events)
-        boredom = self.detect_boredom(events)
-        inactivity = self.detect_inactivity(events)
-        struggle = self.detect_struggle(events)
-        fast_completion = self.detect_fast_completion(events)
+        context = context or self.session_context(events)
+        anomaly = self.detect_anomaly(events, context)
+        boredom = self.detect_boredom(events, context)
+        inactivity = self.detect_inactivity(events, context)
+        struggle = self.detect_struggle(events, context)
+        fast_completion = self.detect_fast_completion(events, context)
         
         alerts = []
         
@@ -376,8 +387,17 @@ class LearnerMonitor:
             }
         }
     
-    def get_recommendations(self, events):
-        analysis = self.analyze_session(events)
+    def append_events(self, user_id, events):
+        """
+        analyze_session() of the learner's whole session after adding
+        `events`; only the new events are processed.
+        """
+        stats = session_store.append(user_id, events)
+        return self.analyze_session(stats)
+    
+    def get_recommendations(self, events, analysis=None):
+        """Actions for the alerts of `analysis` (an analyze_session() result, computed if not given)."""
+        analysis = analysis or self.analyze_session(events)
         recommendations = []
         
         for alert in analysis['alerts']:
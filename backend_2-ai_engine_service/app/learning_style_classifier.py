@@ -4,6 +4,7 @@ from sklearn.tree import DecisionTreeClassifier
 from sklearn.preprocessing import LabelEncoder
 import joblib
 import os
+from .event_features import event_stats
 
 
 class LearningStyleClassifier:
@@ -18,37 +19,33 @@ class LearningStyleClassifier:
         os.makedirs(self.models_dir, exist_ok=True)
     
     def _extract_features(self, events):
-        if not events or len(events) == 0:
+        if events is None or len(events) == 0:
             return None
-        
-        df = pd.DataFrame(events)
+        stats = event_stats(events)
         
         features = {}
         
-        content_type_counts = df['content_type'].value_counts() if 'content_type' in df.columns else pd.Series()
+        content_type_counts = stats.content_types
         features['video_watches'] = content_type_counts.get('video', 0)
         features['audio_listens'] = content_type_counts.get('audio', 0)
         features['reading_views'] = content_type_counts.get('text', 0) + content_type_counts.get('reading', 0)
         features['interactive_plays'] = content_type_counts.get('interactive', 0) + content_type_counts.get('simulation', 0)
         
-        event_types = df['event_type'].value_counts() if 'event_type' in df.columns else pd.Series()
+        event_types = stats.event_types
         features['plays'] = event_types.get('video_play', 0) + event_types.get('audio_play', 0)
         features['listens'] = event_types.get('audio_listen', 0)
         features['reads'] = event_types.get('page_view', 0) + event_types.get('scroll', 0)
         features['clicks'] = event_types.get('click', 0)
         features['interactions'] = event_types.get('interaction', 0)
         
-        if 'timestamp' in df.columns and len(df) > 1:
-            df = df.sort_values('timestamp')
-            time_diffs = df['timestamp'].diff().dt.total_seconds().dropna()
-            
-            features['avg_time_per_event'] = time_diffs.mean() if len(time_diffs) > 0 else 0
-            features['session_duration'] = (df['timestamp'].max() - df['timestamp'].min()).total_seconds()
+        if 'timestamp' in stats.fields and stats.count > 1:
+            features['avg_time_per_event'] = stats.mean_gap_seconds
+            features['session_duration'] = stats.duration_seconds
         else:
             features['avg_time_per_event'] = 0
             features['session_duration'] = 0
         
-        features['total_events'] = len(events)
+        features['total_events'] = stats.count
         
         features['video_completion_rate'] = 0
         features['quiz_attempts'] = event_types.get('quiz_attempt', 0)
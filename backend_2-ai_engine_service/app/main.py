@@ -1,18 +1,28 @@
 from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
-from .schemas import MatchRequest, Profile, CourseResponse, LearnerMatchRequest, CourseMatchResponse, MonitorRequest, MonitorResponse, AdaptiveRecommendRequest, AdaptiveUpdateRequest, LearningStyleRequest
-from .matcher import semantic_search, apply_filters, compose_scores
-from .indexer import build_index, load_index
+from fastapi.responses import StreamingResponse
+from .schemas import MatchRequest, BatchMatchRequest, Profile, CourseResponse, LearnerMatchRequest, CourseMatchResponse, MonitorRequest, MonitorResponse, SessionEventsRequest, BehaviorBatchRequest, AdaptiveRecommendRequest, AdaptiveUpdateRequest, LearningStyleRequest
+from .matcher import match_profile, match_batch
+from .hybrid import hybrid_search
+from .match_cache import match_cache
+from .consumer import consumer_stats
+from .recommendations import get_recommendations
+from .indexer import get_snapshot, registry, list_versions
+from .index_jobs import rebuild_jobs
+from .embeddings import embedding_cache, batcher
+from .user_embeddings import stores as user_embedding_stores
 from .config import settings
 from .behavior_analyzer import analyzer
-from .catalog import load_catalog
+from .catalog import get_catalog, catalog_store
 from .learner_course_matcher import matcher
 from .learner_monitor import monitor
+from .session_store import session_store
 from .adaptive_recommender import recommender
 from .learning_style_classifier import classifier
 import uvicorn
-import pandas as pd
-from typing import Optional, List
+import json
+import redis
+from typing import Literal, Optional, List
 from datetime import datetime
 
 app = FastAPI(
@@ -77,12 +87,55 @@ def match(req: MatchRequest):
     - **profile**: Learner profile with skills, education, experience
     - **top_k**: Number of top matches to return (default: 10)
     - **filters**: Optional filters (nsqf_level, region, language, max_duration_months)
+    - **mode**: `semantic` (default) or `hybrid`, which fuses the semantic ranking with
+      BM25 keyword matches on the profile text using reciprocal rank fusion
     """
     profile = req.profile.dict()
-    sem = semantic_search(profile, top_k=200)
-    filtered = apply_filters(sem, profile, filters=req.filters or {})
-    scored = compose_scores(filtered, profile)
-    return {"matches": scored[:req.top_k], "total": len(scored)}
+    matches, total = match_cache.match(profile, top_k=req.top_k or 10, filters=req.filters or {}, mode=req.mode)
+    return {"matches": matches, "total": total}
+
+
+@app.post("/match/batch", tags=["Matching"])
+def match_batch_profiles(req: BatchMatchRequest):
+    """
+    Match many learner profiles in one call, e.g. for nightly jobs.
+
+    Profiles are embedded and searched in chunks and the response is streamed
+    as NDJSON, one line per profile in request order:
+    `{"index": 0, "user_id": 1, "matches": [...], "total": 12}`
+
+    - **profiles**: Learner profiles
+    - **top_k**: Number of top matches per profile (default: 10)
+    - **filters**: Filters applied to every profile
+    - **profile_filters**: Optional per-profile filters (same order as profiles), merged over `filters`
+    """
+    if req.profile_filters is not None and len(req.profile_filters) != len(req.profiles):
+        raise HTTPException(status_code=422, detail="profile_filters must have one entry per profile")
+    profiles = [p.dict() for p in req.profiles]
+
+    def lines():
+        for i, matches, total in match_batch(profiles, req.filters, req.profile_filters, top_k=req.top_k or 10):
+            yield json.dumps({"index": i, "user_id": profiles[i].get('user_id'), "matches": matches, "total": total}, default=str) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@app.get("/recommendations/{user_id}", tags=["Matching"])
+def recommendations(user_id: int, top_k: int = Query(10, ge=1, le=settings.RECS_TOP_K)):
+    """
+    Recommended courses for a learner, precomputed by the nightly job.
+
+    Falls back to live matching (and stores the result) for learners without a
+    fresh entry, i.e. new learners, changed profiles or entries older than
+    RECS_MAX_AGE_SECONDS. `source` says which one answered.
+    """
+    try:
+        result = get_recommendations(user_id, top_k=top_k)
+    except redis.RedisError as e:
+        raise HTTPException(status_code=503, detail=f"Redis unavailable: {e}")
+    if result is None:
+        raise HTTPException(status_code=404, detail="No profile known for this user")
+    return result
 
 
 @app.post("/match/simple", tags=["Matching"])
@@ -106,9 +159,8 @@ def match_simple(
         "region": region,
         "preferred_nsqf_level": preferred_nsqf_level
     }
-    sem = semantic_search(profile, top_k=200)
-    scored = compose_scores(sem, profile)
-    return {"matches": scored[:top_k]}
+    matches, _ = match_profile(profile, top_k=top_k)
+    return {"matches": matches}
 
 
 @app.post("/match/learner", response_model=List[CourseMatchResponse], tags=["Matching"])
@@ -132,6 +184,7 @@ def match_learner(req: LearnerMatchRequest):
     - **top_k**: Number of top matches to return
     """
     profile = {
+        "user_id": req.user_id,
         "skills": req.skills or [],
         "interests": req.interests or [],
         "career_goal": req.career_goal or "",
@@ -141,20 +194,7 @@ def match_learner(req: LearnerMatchRequest):
         "preferred_language": req.preferred_language or ""
     }
     
-    df = load_catalog()
-    
-    if req.filters:
-        if 'nsqf_level' in req.filters:
-            df = df[df['nsqf_level'] == req.filters['nsqf_level']]
-        if 'region' in req.filters and req.filters['region']:
-            df = df[df['region'].str.lower() == req.filters['region'].lower()]
-        if 'language' in req.filters and req.filters['language']:
-            df = df[df['language'].str.lower() == req.filters['language'].lower()]
-        if 'max_duration_months' in req.filters:
-            df = df[df['duration_months'] <= req.filters['max_duration_months']]
-    
-    courses = df.to_dict('records')
-    matches = matcher.match_courses(profile, courses, top_k=req.top_k or 10)
+    matches = matcher.match_courses(profile, top_k=req.top_k or 10, filters=req.filters)
     
     return matches
 
@@ -179,26 +219,19 @@ def predict_learner_course(
         "preferred_language": preferred_language
     }
     
-    df = load_catalog()
-    course = df[df['course_id'] == course_id]
-    
-    if course.empty:
+    course_dict = get_catalog().get(course_id)
+    if course_dict is None:
         raise HTTPException(status_code=404, detail="Course not found")
     
-    course_dict = course.iloc[0].to_dict()
-    
-    match_pred = matcher.predict_match(profile, course_dict)
-    completion_pred = matcher.predict_completion(profile, course_dict)
-    performance_pred = matcher.predict_performance(profile, course_dict)
-    engagement_pred = matcher.predict_engagement(profile, course_dict)
+    predictions = matcher.predict_match(profile, course_dict)
     
     return {
         "course": course_dict,
         "predictions": {
-            "match": match_pred,
-            "completion": completion_pred,
-            "performance": performance_pred,
-            "engagement": engagement_pred
+            "match": predictions['match_probability'],
+            "completion": predictions['completion_probability'],
+            "performance": predictions['performance_probability'],
+            "engagement": predictions['engagement_probability']
         }
     }
 
@@ -221,7 +254,8 @@ def list_courses(
     region: Optional[str] = Query(None)
 ):
     """List all available NSQF courses with optional filtering."""
-    df = load_catalog()
+    # The shared frame, read-only: the filters below build new frames.
+    df = get_catalog().frame
     
     if nsqf_level is not None:
         df = df[df['nsqf_level'] == nsqf_level]
@@ -235,49 +269,113 @@ def list_courses(
 
 
 @app.get("/courses/search", tags=["Courses"])
-def search_courses(q: str = Query(..., min_length=2)):
-    """Search courses by keyword."""
-    df = load_catalog()
-    mask = (
-        df['title'].str.contains(q, case=False, na=False) |
-        df['description'].str.contains(q, case=False, na=False) |
-        df['skills'].str.contains(q, case=False, na=False) |
-        df['keywords'].str.contains(q, case=False, na=False)
-    )
-    results = df[mask].head(20).to_dict(orient='records')
-    return {"results": results, "count": len(results)}
+def search_courses(
+    q: str = Query(..., min_length=2),
+    limit: int = Query(20, ge=1, le=100),
+    mode: Literal["keyword", "hybrid"] = Query("keyword")
+):
+    """
+    Search courses by keyword, ranked by BM25 relevance.
+
+    Title matches weigh most, then skills, keywords and description. Words
+    also match longer words they start (e.g. "elec" finds "electrician").
+    With `mode=hybrid` the keyword ranking is fused with semantic similarity
+    to the query (reciprocal rank fusion), ordered by `_rrf_score`.
+    """
+    if mode == "hybrid":
+        results, total = hybrid_search(q, limit=limit)
+        return {"results": results, "count": len(results), "total": total}
+
+    catalog = get_catalog()
+    positions, scores, total = catalog.search_index.search(q, limit=limit)
+    results = catalog.frame.iloc[positions].to_dict(orient='records')
+    for course, score in zip(results, scores):
+        course['_score'] = float(score)
+    return {"results": results, "count": len(results), "total": total}
+
+
+@app.get("/courses/by-ids", tags=["Courses"])
+def get_courses_by_ids(ids: List[str] = Query(..., description="Course ids, repeated or comma separated")):
+    """Get several courses in one call, in the order requested."""
+    course_ids = [c.strip() for value in ids for c in value.split(",") if c.strip()]
+    if len(course_ids) > 500:
+        raise HTTPException(status_code=422, detail="At most 500 course ids per request")
+    snapshot = get_snapshot()
+    courses, missing = [], []
+    for course_id in course_ids:
+        course = snapshot.course(course_id)
+        if course is None:
+            missing.append(course_id)
+        else:
+            courses.append(course)
+    return {"courses": courses, "missing": missing}
 
 
 @app.get("/course/{course_id}", tags=["Courses"])
 def get_course(course_id: str):
     """Get detailed information about a specific course."""
-    _, meta = load_index()
-    for m in meta:
-        if str(m.get('course_id')) == str(course_id):
-            return m
-    raise HTTPException(status_code=404, detail="Course not found")
+    course = get_snapshot().course(course_id)
+    if course is None:
+        raise HTTPException(status_code=404, detail="Course not found")
+    return course
 
 
-@app.post("/admin/rebuild_index", tags=["Admin"])
+@app.post("/admin/rebuild_index", status_code=202, tags=["Admin"])
 def admin_rebuild():
-    """Rebuild the FAISS index for course matching."""
-    idx, meta = build_index(rebuild=True)
-    return {"ok": True, "count": len(meta), "message": "Index rebuilt successfully"}
+    """
+    Start a background rebuild of the FAISS index for course matching.
+
+    The new index is written to its own version directory and swapped in
+    once complete; the current version keeps serving until then. Poll
+    `/admin/rebuild_index/{job_id}` for status and progress.
+    """
+    job = rebuild_jobs.submit()
+    return {"ok": True, "job": job, "message": "Index rebuild started"}
+
+
+@app.get("/admin/rebuild_index", tags=["Admin"])
+def admin_rebuild_jobs():
+    """List recent index rebuild jobs and available index versions."""
+    return {"jobs": rebuild_jobs.list(), "current_version": registry.version, "versions": list_versions()}
+
+
+@app.get("/admin/rebuild_index/{job_id}", tags=["Admin"])
+def admin_rebuild_status(job_id: str):
+    """Get status and progress of an index rebuild job."""
+    job = rebuild_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Rebuild job not found")
+    return job
+
+
+@app.get("/admin/consumer", tags=["Admin"])
+def admin_consumer(group: Optional[str] = Query(None)):
+    """Recommendation consumer lag, pending entries, dead letters and per-worker throughput."""
+    try:
+        return consumer_stats(group)
+    except redis.RedisError as e:
+        raise HTTPException(status_code=503, detail=f"Redis unavailable: {e}")
 
 
 @app.get("/admin/stats", tags=["Admin"])
 def admin_stats():
     """Get service statistics."""
     try:
-        _, meta = load_index()
-        course_count = len(meta)
-    except:
-        df = load_catalog()
-        course_count = len(df)
+        # Counted from the snapshot's ids, without loading the FAISS index.
+        course_count = get_snapshot().ntotal
+    except Exception:
+        course_count = len(get_catalog())
     
     return {
         "courses_indexed": course_count,
         "embedding_model": settings.EMBEDDING_MODEL,
+        "index": registry.stats(),
+        "catalog": catalog_store.stats(),
+        "embedding_cache": embedding_cache.stats(),
+        "match_cache": match_cache.stats(),
+        "user_embeddings": {name: store.stats() for name, store in user_embedding_stores.items()},
+        "embedding_batcher": batcher.stats(),
+        "sessions": session_store.stats(),
         "timestamp": datetime.utcnow().isoformat()
     }
 
@@ -302,11 +400,7 @@ def analyze_behavior(request: dict):
             }
         }
     
-    df = pd.DataFrame(events)
-    if 'timestamp' in df.columns:
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
-    
-    return analyzer.get_recommendation(df)
+    return analyzer.get_recommendation(events)
 
 
 @app.post("/behavior/engagement", tags=["Behavior"])
@@ -316,11 +410,7 @@ def predict_engagement(request: dict):
     if not events:
         return {'engagement_score': 50, 'confidence': 0}
     
-    df = pd.DataFrame(events)
-    if 'timestamp' in df.columns:
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
-    
-    return analyzer.predict_engagement(df)
+    return analyzer.predict_engagement(events)
 
 
 @app.post("/behavior/dropout", tags=["Behavior"])
@@ -330,11 +420,24 @@ def predict_dropout(request: dict):
     if not events:
         return {'dropout_probability': 0.5, 'risk_level': 'medium'}
     
-    df = pd.DataFrame(events)
-    if 'timestamp' in df.columns:
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
+    return analyzer.predict_dropout(events)
+
+
+@app.post("/behavior/score/batch", tags=["Behavior"])
+def score_behavior_batch(request: BehaviorBatchRequest):
+    """
+    Engagement, dropout and recommendation for many learners in one call.
+    
+    - **learners**: `{user_id, events}` or `{user_id, features}` with a precomputed model input row
+    - **n_jobs**: threads used by the models (default BEHAVIOR_BATCH_N_JOBS)
     
-    return analyzer.predict_dropout(df)
+    Results are a list in request order, each with the learner's `user_id`.
+    """
+    try:
+        results = analyzer.score_batch([learner.dict() for learner in request.learners], n_jobs=request.n_jobs)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return {'results': results}
 
 
 @app.post("/behavior/train", tags=["Behavior"])
@@ -357,9 +460,33 @@ def monitor_analyze(request: MonitorRequest):
     - Fast completion (suspiciously quick completion)
     
     - **events**: List of learner events with timestamps
-    - **user_id**: Optional user identifier
+    - **user_id**: Optional user identifier; the session can then be
+      continued with POST /monitor/session/{user_id}/events
+    
+    The response includes the /monitor/recommendations actions for the alerts.
+    """
+    analysis = monitor.analyze_session(request.events, request.user_id)
+    return dict(analysis, recommendations=monitor.get_recommendations(request.events, analysis))
+
+
+@app.post("/monitor/session/{user_id}/events", response_model=MonitorResponse, tags=["Monitoring"])
+def monitor_append_events(user_id: str, request: SessionEventsRequest):
+    """
+    Add new events to a learner's session and analyze the whole session.
+    
+    Only the new events are sent and processed; the session's running
+    aggregates are kept server-side (SESSION_TTL_SECONDS after the last
+    update).  A session starts with the first events sent.
     """
-    return monitor.analyze_session(request.events, request.user_id)
+    analysis = monitor.append_events(user_id, request.events)
+    return dict(analysis, recommendations=monitor.get_recommendations(request.events, analysis))
+
+
+@app.delete("/monitor/session/{user_id}", tags=["Monitoring"])
+def monitor_reset_session(user_id: str):
+    """Forget a learner's session state."""
+    session_store.reset(user_id)
+    return {'ok': True, 'user_id': user_id}
 
 
 @app.post("/monitor/boredom", tags=["Monitoring"])
@@ -0,0 +1,97 @@
+import hashlib
+import json
+import threading
+from .config import settings
+from .cache import LRUCache, RedisTier
+from .catalog import get_catalog
+from .indexer import get_snapshot
+from .matcher import match_profile
+from .hybrid import hybrid_match
+
+# Profile fields that influence /match results: profile_text() uses the
+# first three, compose_scores the rest.
+PROFILE_FIELDS = ("headline", "skills", "education", "preferred_nsqf_level", "region")
+
+
+class MatchResultCache:
+    """
+    /match responses keyed by a canonical hash of everything that affects
+    them, including the index version (and catalog version for hybrid).
+    A new index version makes old entries unreachable: the local tier is
+    cleared as soon as a request sees it, and Redis entries simply expire
+    after MATCH_CACHE_TTL_SECONDS.
+    """
+
+    def __init__(self):
+        self.local = LRUCache(settings.MATCH_CACHE_SIZE, ttl=settings.MATCH_CACHE_TTL_SECONDS)
+        self.shared = RedisTier("shikshadisha:match:", ttl=settings.MATCH_CACHE_TTL_SECONDS) if settings.MATCH_CACHE_REDIS else None
+        self._lock = threading.Lock()
+        self._version = None
+        self.invalidations = 0
+
+    @staticmethod
+    def key(profile, filters, top_k, mode, version):
+        fields = {f: profile.get(f) for f in PROFILE_FIELDS}
+        payload = json.dumps([fields, filters or {}, top_k, mode, version], sort_keys=True, default=str)
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+    def _observe(self, version):
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    if self._version is not None:
+                        self.local.clear()
+                        self.invalidations += 1
+                    self._version = version
+
+    def get(self, key):
+        result = self.local.get(key)
+        if result is None and self.shared is not None:
+            raw = self.shared.get(key)
+            if raw is not None:
+                result = json.loads(raw)
+                self.local.set(key, result)
+        return result
+
+    def put(self, key, result):
+        self.local.set(key, result)
+        if self.shared is not None:
+            self.shared.set(key, json.dumps(result, default=str))
+
+    def match(self, profile, top_k=10, filters=None, mode="semantic"):
+        """Cached match_profile / hybrid_match; returns (matches, total)."""
+        if settings.MATCH_CACHE_SIZE <= 0:
+            return self._compute(profile, top_k, filters, mode)
+
+        try:
+            version = get_snapshot().version
+        except Exception:
+            # No usable index: match_profile falls back to searching the
+            # catalog, and there is no version to key the result on.
+            return self._compute(profile, top_k, filters, mode)
+        self._observe(version)
+        if mode == "hybrid":
+            version = [version, get_catalog().signature]
+
+        key = self.key(profile, filters, top_k, mode, version)
+        result = self.get(key)
+        if result is None:
+            matches, total = self._compute(profile, top_k, filters, mode)
+            result = {"matches": matches, "total": total}
+            self.put(key, result)
+        return result["matches"], result["total"]
+
+    @staticmethod
+    def _compute(profile, top_k, filters, mode):
+        if mode == "hybrid":
+            return hybrid_match(profile, top_k=top_k, filters=filters)
+        return match_profile(profile, top_k=top_k, filters=filters)
+
+    def stats(self):
+        stats = {'local': self.local.stats(), 'invalidations': self.invalidations}
+        if self.shared is not None:
+            stats['redis'] = self.shared.stats()
+        return stats
+
+
+match_cache = MatchResultCache()
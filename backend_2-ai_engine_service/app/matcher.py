@@ -1,42 +1,57 @@
 
+import json
 import numpy as np
+from .config import settings
 from .embeddings import embed_texts
 from .catalog import load_catalog
-from .indexer import load_index
+from .indexer import get_snapshot
+from .user_embeddings import embed_profiles
 
-def semantic_search(profile, top_k=10):
-    profile_text = f"{profile.get('headline', '')}. Skills: {', '.join(profile.get('skills', []))}"
+# Candidates (after filtering) reranked with compose_scores, as many as the
+# former semantic_search(top_k=200) retrieved, so boosts can still lift a
+# course from well below the top_k.
+RERANK_POOL = 400
+
+def profile_text(profile):
+    text = f"{profile.get('headline', '')}. Skills: {', '.join(profile.get('skills', []))}"
     if profile.get('education'):
-        profile_text += f" Education: {profile['education']}"
-    
-    profile_emb = embed_texts([profile_text])[0]
+        text += f" Education: {profile['education']}"
+    return text
+
+
+def semantic_search(profile, top_k=10, filters=None):
+    """
+    Retrieve courses closest to the profile. `filters` (same keys as
+    apply_filters) are applied inside the index search, so every returned
+    candidate already satisfies them.
+    """
+    profile_emb = embed_texts([profile_text(profile)])[0]
     
     try:
-        index, meta = load_index()
-        search_k = min(top_k * 2, index.ntotal)
-        scores, indices = index.search(profile_emb.reshape(1, -1), search_k)
+        snapshot = get_snapshot()
+        mask = snapshot.filter_mask(filters)
+        scores, indices = snapshot.search(profile_emb.reshape(1, -1), top_k * 2, mask=mask)
         
         results = []
         for score, idx in zip(scores[0], indices[0]):
             if idx >= 0:
-                course = meta[idx].copy()
+                course = snapshot.meta[idx].copy()
                 course['_score'] = float(score)
                 results.append(course)
         return results
     except Exception as e:
         catalog_df = load_catalog()
         catalog_texts = (catalog_df['title'] + ". " + catalog_df['description'] + " Skills: " + catalog_df['skills']).tolist()
-        catalog_embs = embed_texts(catalog_texts)
+        catalog_embs = embed_texts(catalog_texts, use_cache=False)
         
         sims = np.dot(catalog_embs, profile_emb)
-        top_idx = sims.argsort()[::-1][:top_k]
         
         results = []
-        for idx in top_idx:
+        for idx in sims.argsort()[::-1]:
             course = catalog_df.iloc[idx].to_dict()
             course['_score'] = float(sims[idx])
             results.append(course)
-        return results
+        return apply_filters(results, profile, filters)[:top_k]
 
 
 def apply_filters(results, profile, filters=None):
@@ -97,3 +112,77 @@ def compose_scores(results, profile):
     
     results.sort(key=lambda x: x.get('_final_score', 0), reverse=True)
     return results
+
+
+def _rank(snapshot, profiles, embs, filters, top_k, pool):
+    """
+    Search `pool` candidates per profile (one multi-query index search) and
+    compose their scores with the snapshot's columnar reranker.  Returns one
+    (matches, total) pair per profile; scores equal compose_scores'.
+    """
+    scores, positions = snapshot.search(embs, pool, mask=snapshot.filter_mask(filters))
+    final = snapshot.reranker.compose(profiles, scores, positions)
+    order = np.argsort(-final, axis=1, kind='stable')
+    ranked = []
+    for i in range(len(profiles)):
+        matches = []
+        for j in order[i]:
+            pos = positions[i, j]
+            if pos < 0:
+                break
+            course = snapshot.meta[pos].copy()
+            course['_score'] = float(scores[i, j])
+            course['_final_score'] = float(final[i, j])
+            matches.append(course)
+        ranked.append((matches[:top_k], len(matches)))
+    return ranked
+
+
+def match_profile(profile, top_k=10, filters=None, pool=None):
+    """
+    semantic_search + compose_scores for one profile, reranked over the
+    snapshot's columns.  Returns (top_k matches, number of candidates).
+    `pool` is how many candidates are retrieved (default RERANK_POOL).
+    """
+    pool = pool or max(RERANK_POOL, top_k)
+    try:
+        snapshot = get_snapshot()
+    except Exception:
+        scored = compose_scores(semantic_search(profile, top_k=pool // 2, filters=filters), profile)
+        return scored[:top_k], len(scored)
+    embs = embed_profiles("match", [profile.get('user_id')], [profile_text(profile)])
+    return _rank(snapshot, [profile], embs, filters, top_k, pool)[0]
+
+
+def match_batch(profiles, filters=None, profile_filters=None, top_k=10):
+    """
+    Match many profiles at once, yielding (position, matches, total) in input
+    order. Each chunk of MATCH_BATCH_CHUNK_SIZE profiles is embedded in one
+    call and searched with one multi-query index search per distinct filter
+    set, so results are the same as match_profile for each profile.
+
+    `filters` apply to every profile; `profile_filters[i]`, when given, is
+    merged over them for profile i.
+    """
+    snapshot = get_snapshot()
+    chunk_size = settings.MATCH_BATCH_CHUNK_SIZE
+    for start in range(0, len(profiles), chunk_size):
+        chunk = profiles[start:start + chunk_size]
+        embs = embed_profiles("match", [p.get('user_id') for p in chunk], [profile_text(p) for p in chunk])
+
+        groups = {}
+        for offset in range(len(chunk)):
+            merged = dict(filters or {})
+            if profile_filters and profile_filters[start + offset]:
+                merged.update(profile_filters[start + offset])
+            key = json.dumps(merged, sort_keys=True, default=str)
+            groups.setdefault(key, (merged, []))[1].append(offset)
+
+        results = [None] * len(chunk)
+        for group_filters, rows in groups.values():
+            ranked = _rank(snapshot, [chunk[r] for r in rows], embs[rows], group_filters, top_k, max(RERANK_POOL, top_k))
+            for row, result in zip(rows, ranked):
+                results[row] = result
+
+        for offset, (matches, total) in enumerate(results):
+            yield start + offset, matches, total
@@ -0,0 +1,149 @@
+"""
+Materialized "recommended courses" per learner.
+
+The consumer records the latest profile of every active learner in the
+PROFILES_KEY hash.  A nightly job (cron / k8s CronJob)
+
+    python -m app.recommendations
+    python -m app.recommendations --profiles profiles.jsonl
+
+recomputes top RECS_TOP_K matches for all of them in chunks (bulk
+embedding, one multi-query index search and a vectorized rerank per chunk,
+see matcher.match_batch) and writes them to the RECS_KEY hash.
+GET /recommendations/{user_id} serves from there and only matches live for
+new users, changed profiles or entries older than RECS_MAX_AGE_SECONDS.
+"""
+import argparse
+import hashlib
+import json
+import time
+import redis
+from .config import settings
+from .indexer import get_snapshot
+from .matcher import match_batch
+from .match_cache import PROFILE_FIELDS, match_cache
+from .user_embeddings import flush_stores
+
+PROFILES_KEY = "shikshadisha:profiles"
+RECS_KEY = "shikshadisha:recommendations"
+
+# Course fields kept per recommendation; clients fetch full details with
+# GET /courses/by-ids.
+COURSE_FIELDS = ("course_id", "title", "nsqf_level", "duration_months", "language", "region")
+
+r = redis.from_url(settings.REDIS_URL, decode_responses=True)
+
+
+def profile_hash(profile):
+    fields = {f: profile.get(f) for f in PROFILE_FIELDS}
+    return hashlib.sha1(json.dumps(fields, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def record_profiles(profiles, client=None):
+    """Remember the latest profile of each user with one HSET (`client` may be a pipeline)."""
+    mapping = {str(p['user_id']): json.dumps(p, default=str) for p in profiles if p.get('user_id') is not None}
+    if mapping:
+        (client or r).hset(PROFILES_KEY, mapping=mapping)
+
+
+def _compact(matches):
+    return [dict({f: m.get(f) for f in COURSE_FIELDS}, score=m.get('_final_score')) for m in matches]
+
+
+def _entry(profile, matches, top_k, version):
+    return {
+        "user_id": profile['user_id'],
+        "top_k": top_k,
+        "matches": _compact(matches),
+        "profile_hash": profile_hash(profile),
+        "index_version": version,
+        "generated_at": time.time(),
+    }
+
+
+def iter_profiles(client=None, path=None):
+    """Profiles from a JSONL file, or every profile recorded in Redis."""
+    if path:
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        return
+    for _, raw in (client or r).hscan_iter(PROFILES_KEY, count=1000):
+        yield json.loads(raw)
+
+
+def materialize(profiles, top_k=None, client=None, chunk_size=None):
+    """
+    Compute and store recommendations for every profile with a user_id.
+    Results are written with one HSET per chunk.  Returns counts.
+    """
+    client = client or r
+    top_k = top_k or settings.RECS_TOP_K
+    chunk_size = chunk_size or settings.MATCH_BATCH_CHUNK_SIZE
+    version = get_snapshot().version
+    stored = skipped = 0
+    chunk = []
+
+    def flush():
+        nonlocal stored
+        mapping = {}
+        for i, matches, _ in match_batch(chunk, top_k=top_k):
+            mapping[str(chunk[i]['user_id'])] = json.dumps(_entry(chunk[i], matches, top_k, version), default=str)
+        client.hset(RECS_KEY, mapping=mapping)
+        stored += len(mapping)
+        chunk.clear()
+
+    for profile in profiles:
+        if profile.get('user_id') is None:
+            skipped += 1
+            continue
+        chunk.append(profile)
+        if len(chunk) >= chunk_size:
+            flush()
+    if chunk:
+        flush()
+    return {"stored": stored, "skipped": skipped, "index_version": version}
+
+
+def get_recommendations(user_id, top_k=10, client=None):
+    """
+    Stored recommendations for `user_id`, recomputed live (and stored) when
+    missing, older than RECS_MAX_AGE_SECONDS, shorter than top_k or computed
+    for a different profile.  None when the user's profile is unknown.
+    """
+    client = client or r
+    pipe = client.pipeline(transaction=False)
+    pipe.hget(RECS_KEY, str(user_id))
+    pipe.hget(PROFILES_KEY, str(user_id))
+    raw_entry, raw_profile = pipe.execute()
+    entry = json.loads(raw_entry) if raw_entry else None
+    profile = json.loads(raw_profile) if raw_profile else None
+
+    fresh = (
+        entry is not None
+        and time.time() - entry["generated_at"] <= settings.RECS_MAX_AGE_SECONDS
+        and entry["top_k"] >= top_k
+        and (profile is None or entry["profile_hash"] == profile_hash(profile))
+    )
+    if fresh:
+        return dict(entry, matches=entry["matches"][:top_k], source="materialized")
+    if profile is None:
+        return None
+
+    stored_k = max(top_k, settings.RECS_TOP_K)
+    matches, _ = match_cache.match(profile, top_k=stored_k)
+    entry = _entry(profile, matches, stored_k, get_snapshot().version)
+    client.hset(RECS_KEY, str(user_id), json.dumps(entry, default=str))
+    return dict(entry, matches=entry["matches"][:top_k], source="live")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profiles", help="JSONL file of profiles (default: profiles recorded by the consumer)")
+    parser.add_argument("--top-k", type=int, default=settings.RECS_TOP_K)
+    args = parser.parse_args()
+    started = time.time()
+    result = materialize(iter_profiles(path=args.profiles), top_k=args.top_k)
+    flush_stores()
+    print(json.dumps(dict(result, seconds=round(time.time() - started, 1))))
@@ -0,0 +1,152 @@
+import numpy as np
+
+
+def _as_level(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _text(value):
+    return value.lower() if isinstance(value, str) else ""
+
+
+class SkillMatrix:
+    """
+    Course skill sets as CSR rows of token ids, so overlaps with many
+    learners can be counted without building Python sets per course.
+    """
+
+    def __init__(self, skill_sets):
+        self.vocab = {}
+        indptr = [0]
+        indices = []
+        for skills in skill_sets:
+            for token in skills:
+                indices.append(self.vocab.setdefault(token, len(self.vocab)))
+            indptr.append(len(indices))
+        self.indptr = np.array(indptr, dtype=np.int64)
+        self.indices = np.array(indices, dtype=np.int64)
+        self.lengths = np.diff(self.indptr)
+
+    def user_matrix(self, user_skill_sets):
+        """(n_users, vocab) bool matrix and the size of each user's skill set."""
+        matrix = np.zeros((len(user_skill_sets), len(self.vocab) + 1), dtype=bool)
+        sizes = np.zeros(len(user_skill_sets), dtype=np.int64)
+        for row, skills in enumerate(user_skill_sets):
+            sizes[row] = len(skills)
+            ids = [self.vocab[s] for s in skills if s in self.vocab]
+            matrix[row, ids] = True
+        return matrix, sizes
+
+    def intersections(self, user_matrix, positions):
+        """
+        |user skills & course skills| for a (n_users, k) array of course
+        positions; row i of `positions` is scored against user i.
+        """
+        n_users, k = positions.shape
+        flat = positions.reshape(-1)
+        lengths = self.lengths[flat]
+        pair = np.repeat(np.arange(n_users * k), lengths)
+        # Offsets of each pair's tokens inside self.indices.
+        starts = np.repeat(self.indptr[flat], lengths)
+        within = np.arange(len(pair)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        tokens = self.indices[starts + within]
+        hits = user_matrix[pair // k, tokens]
+        return np.bincount(pair, weights=hits, minlength=n_users * k).reshape(n_users, k)
+
+
+def _codes(values, vocab):
+    return np.array([vocab.setdefault(v, len(vocab)) for v in values], dtype=np.int64)
+
+
+class ColumnarReranker:
+    """
+    Per-course columns (nsqf level, region and language ids, skill token
+    rows) built once per index snapshot.  compose() reproduces
+    matcher.compose_scores for a whole (profiles x candidates) block and
+    compose_learner() the LearnerCourseMatcher boosts, each in a few array
+    operations instead of a Python loop over candidate dicts.
+    """
+
+    def __init__(self, meta):
+        self.nsqf_level = np.array([_as_level(m.get('nsqf_level')) for m in meta], dtype=np.float64)
+        self.region_vocab = {}
+        self.region = _codes((_text(m.get('region', '')) for m in meta), self.region_vocab)
+        self.language_vocab = {}
+        self.language = _codes((_text(m.get('language', '')) for m in meta), self.language_vocab)
+        self.match_probability = np.array([m.get('match_probability', 0.5) for m in meta], dtype=np.float64)
+        self.has_skills = np.array([bool(m.get('skills')) for m in meta], dtype=bool)
+        # compose_scores splits skills on ',' while the learner matcher uses
+        # the catalog's ';' separator, so each scorer keeps its own tokens.
+        self.skills = SkillMatrix(
+            [set(s.lower() for s in str(m.get('skills', '')).split(',')) for m in meta]
+        )
+        self.learner_skills = SkillMatrix(
+            [set(s.lower().strip() for s in str(m.get('skills', '')).split(';')) for m in meta]
+        )
+
+    def compose(self, profiles, scores, positions):
+        """
+        Final scores for candidates `positions` (n_profiles, k) with semantic
+        `scores`.  Empty slots (position -1) come back as -inf.
+        """
+        valid = positions >= 0
+        safe = np.where(valid, positions, 0)
+        final = scores.astype(np.float64)
+
+        preferred = np.array([_as_level(p.get('preferred_nsqf_level')) or np.nan for p in profiles])
+        levels = self.nsqf_level[safe]
+        nsqf_boost = np.maximum(0, 0.3 - np.abs(levels - preferred[:, None]) * 0.1)
+        has_level = ~np.isnan(preferred)[:, None] & (levels != 0) & ~np.isnan(levels)
+        final = final + np.where(has_level, nsqf_boost, 0.0)
+
+        user_skills = [set(s.lower() for s in (p.get('skills') or [])) for p in profiles]
+        user_matrix, user_sizes = self.skills.user_matrix(user_skills)
+        inter = self.skills.intersections(user_matrix, safe)
+        union = user_sizes[:, None] + self.skills.lengths[safe] - inter
+        final = final + inter / np.maximum(union, 1) * 0.2
+
+        user_region = np.array([
+            self.region_vocab.get(_text(p.get('region') or ''), -1) if p.get('region') else -2
+            for p in profiles
+        ])
+        final = final + np.where(self.region[safe] == user_region[:, None], 0.1, 0.0)
+
+        final = np.minimum(final, 1.0)
+        return np.where(valid, final, -np.inf)
+
+    def compose_learner(self, profile, scores, positions):
+        """
+        LearnerCourseMatcher scoring for one profile over valid candidate
+        `positions` (1-d).  Returns (final_score, skill_match, level_diff);
+        level_diff is against the level used for predictions.
+        """
+        levels = self.nsqf_level[positions]
+        preferred = profile.get('preferred_nsqf_level')
+
+        diff = np.abs((1 if preferred is None else preferred) - levels)
+        final = scores.astype(np.float64) * 0.7
+        final = final + np.select([diff == 0, diff <= 1, diff <= 2], [0.15, 0.1, 0.05], 0.0)
+
+        user_lang = _text(profile.get('preferred_language'))
+        if user_lang:
+            contains = np.array([user_lang in lang for lang in self.language_vocab], dtype=bool)
+            final = final + np.where(contains[self.language[positions]], 0.1, 0.0)
+
+        user_region = _text(profile.get('region'))
+        if user_region:
+            same = self.region[positions] == self.region_vocab.get(user_region, -1)
+            final = final + np.where(same, 0.05, 0.0)
+
+        skill_match = np.full(len(positions), 0.5)
+        user_skills = profile.get('skills')
+        if user_skills:
+            tokens = set(s.lower() for s in user_skills) if isinstance(user_skills, list) else set()
+            matrix, _ = self.learner_skills.user_matrix([tokens])
+            inter = self.learner_skills.intersections(matrix, positions[None, :])[0]
+            skill_match = np.where(self.has_skills[positions] & (inter > 0), np.minimum(0.95, 0.5 + inter * 0.15), 0.5)
+
+        level_diff = np.abs((4 if preferred is None else preferred) - levels)
+        return final, skill_match, level_diff
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Literal
 
 class Profile(BaseModel):
     user_id: Optional[int] = None
@@ -18,8 +18,16 @@ class MatchRequest(BaseModel):
     profile: Profile
     top_k: Optional[int] = 10
     filters: Optional[Dict[str, Any]] = None
+    mode: Literal["semantic", "hybrid"] = "semantic"
+
+class BatchMatchRequest(BaseModel):
+    profiles: List[Profile]
+    top_k: Optional[int] = 10
+    filters: Optional[Dict[str, Any]] = None
+    profile_filters: Optional[List[Optional[Dict[str, Any]]]] = None
 
 class LearnerMatchRequest(BaseModel):
+    user_id: Optional[int] = None
     skills: Optional[List[str]] = []
     interests: Optional[List[str]] = []
     career_goal: Optional[str] = ""
@@ -70,10 +78,22 @@ class CourseResponse(BaseModel):
     matches: List[Dict[str, Any]]
     total: int
 
+class BehaviorLearner(BaseModel):
+    user_id: Any
+    events: Optional[List[Dict[str, Any]]] = None
+    features: Optional[List[float]] = None
+
+class BehaviorBatchRequest(BaseModel):
+    learners: List[BehaviorLearner]
+    n_jobs: Optional[int] = None
+
 class MonitorRequest(BaseModel):
     events: List[Dict[str, Any]]
     user_id: Optional[str] = None
 
+class SessionEventsRequest(BaseModel):
+    events: List[Dict[str, Any]]
+
 class MonitorAlert(BaseModel):
     type: str
     severity: str
@@ -90,6 +110,7 @@ class MonitorResponse(BaseModel):
     overall_status: str
     alerts: List[MonitorAlert]
     analysis: MonitorAnalysis
+    recommendations: Optional[List[Dict[str, Any]]] = None
 
 class LearnerState(BaseModel):
     engagement_score: Optional[float] = 50.0
@@ -0,0 +1,118 @@
+import bisect
+import re
+import unicodedata
+import numpy as np
+
+# Field weights for BM25F: a hit in the title counts more than one in the
+# skills, keywords or description.
+FIELD_BOOSTS = {"title": 3.0, "skills": 2.0, "keywords": 1.5, "description": 1.0}
+K1 = 1.2
+B = 0.75
+# Query terms also match longer index terms they are a prefix of ("elec"
+# -> "electrician"), at a discount and for at most MAX_PREFIX_EXPANSIONS
+# terms so very short prefixes stay cheap.
+PREFIX_WEIGHT = 0.5
+MIN_PREFIX_LENGTH = 2
+MAX_PREFIX_EXPANSIONS = 50
+
+# Letters and digits of any script.  Indic vowel signs and viramas (and
+# Latin combining accents) are marks, which \w does not match, so they are
+# listed explicitly to keep words like "विकास" in one token.
+_TOKEN = re.compile(r"(?:[^\W_]|[\u0300-\u036f\u0900-\u0963\u0966-\u0dff])+")
+
+
+def tokenize(text):
+    return _TOKEN.findall(unicodedata.normalize("NFC", text).casefold()) if isinstance(text, str) else []
+
+
+class SearchIndex:
+    """
+    Inverted index over the catalog's text fields with BM25F scoring.
+
+    Each term's postings are a row-position array plus the precomputed,
+    length-normalised and field-weighted term frequency for that row, so a
+    query is a handful of vectorised adds into one score array.
+    """
+
+    def __init__(self, records, fields=FIELD_BOOSTS, k1=K1, b=B):
+        self.k1 = k1
+        self.size = len(records)
+        vocab = {}
+        term_ids, rows, weights = [], [], []
+        for field, boost in fields.items():
+            tokens = [tokenize(r.get(field, "")) for r in records]
+            lengths = np.fromiter((len(t) for t in tokens), dtype=np.float64, count=self.size)
+            avg_length = max(lengths.mean(), 1.0) if self.size else 1.0
+            # Every token occurrence adds boost / length-norm to its (term, row).
+            token_weight = boost / (1 - b + b * lengths / avg_length)
+            for row, row_tokens in enumerate(tokens):
+                term_ids.extend(vocab.setdefault(t, len(vocab)) for t in row_tokens)
+            rows.append(np.repeat(np.arange(self.size, dtype=np.int64), lengths.astype(np.int64)))
+            weights.append(np.repeat(token_weight, lengths.astype(np.int64)))
+
+        term_ids = np.array(term_ids, dtype=np.int64)
+        rows = np.concatenate(rows) if rows else np.empty(0, dtype=np.int64)
+        weights = np.concatenate(weights) if weights else np.empty(0)
+        pairs, inverse = np.unique(term_ids * max(self.size, 1) + rows, return_inverse=True)
+        tf = np.bincount(inverse, weights=weights, minlength=len(pairs))
+        pair_terms, pair_rows = np.divmod(pairs, max(self.size, 1))
+        bounds = np.searchsorted(pair_terms, np.arange(len(vocab) + 1))
+
+        self.terms = sorted(vocab)
+        self.postings = {}
+        for term, term_id in vocab.items():
+            lo, hi = bounds[term_id], bounds[term_id + 1]
+            term_tf = tf[lo:hi]
+            idf = np.log(1 + (self.size - (hi - lo) + 0.5) / (hi - lo + 0.5))
+            self.postings[term] = (pair_rows[lo:hi], idf * term_tf * (k1 + 1) / (term_tf + k1))
+
+    def _expand(self, token):
+        """(term, weight) pairs a query token matches."""
+        matches = [(token, 1.0)] if token in self.postings else []
+        if len(token) < MIN_PREFIX_LENGTH:
+            return matches
+        start = bisect.bisect_right(self.terms, token)
+        stop = bisect.bisect_left(self.terms, token + "\uffff", lo=start)
+        longer = self.terms[start:stop]
+        if len(longer) > MAX_PREFIX_EXPANSIONS:
+            # Keep the expansions found in the most courses.
+            longer = sorted(longer, key=lambda t: len(self.postings[t][0]), reverse=True)[:MAX_PREFIX_EXPANSIONS]
+        return matches + [(t, PREFIX_WEIGHT) for t in longer]
+
+    def scores(self, query):
+        """Dense BM25F score per row (0 where nothing matched)."""
+        scores = np.zeros(self.size, dtype=np.float64)
+        for token in dict.fromkeys(tokenize(query)):
+            expansions = self._expand(token)
+            if len(expansions) == 1:
+                term, weight = expansions[0]
+                rows, contribution = self.postings[term]
+                scores[rows] += weight * contribution
+                continue
+            # A row matching several expansions of one token counts once,
+            # with its best-scoring expansion.
+            best = np.zeros(self.size, dtype=np.float64)
+            for term, weight in expansions:
+                rows, contribution = self.postings[term]
+                best[rows] = np.maximum(best[rows], weight * contribution)
+            scores += best
+        return scores
+
+    def search(self, query, limit=20, allowed=None):
+        """
+        Top `limit` (positions, scores) by descending relevance, ties in
+        catalog order.  `allowed` is an optional bool mask of eligible rows.
+        Returns the total number of matching rows as well.
+        """
+        scores = self.scores(query)
+        if allowed is not None:
+            scores = np.where(allowed, scores, 0.0)
+        matched = np.flatnonzero(scores > 0)
+        if len(matched) > limit:
+            top = np.argpartition(-scores[matched], limit - 1)[:limit]
+            candidates = matched[top]
+        else:
+            candidates = matched
+        order = np.lexsort((candidates, -scores[candidates]))
+        positions = candidates[order]
+        return positions, scores[positions], len(matched)
@@ -0,0 +1,90 @@
+"""
+Per-learner session state for LearnerMonitor.
+
+Instead of every raw event of a session, a learner's state is the running
+aggregates of an EventStats built with keep_times=False: event type and
+engagement counters, distinct content, scroll depth, first/last timestamp,
+max gap and inactive periods.  Clients POST only the new events and get an
+analysis of the whole session in O(new events).
+
+States live in a local LRU (SESSION_STORE_SIZE learners, idle ones dropped
+after SESSION_TTL_SECONDS).  With SESSION_STORE_REDIS they are also stored
+as JSON in Redis, which is then authoritative so all workers see the same
+session (the local copy only serves while Redis is unavailable).
+Concurrent appends for one learner from different workers are last write
+wins.
+"""
+import json
+import threading
+from .config import settings
+from .cache import LRUCache, RedisTier
+from .event_features import EventStats
+
+
+def _snapshot(stats):
+    return EventStats.from_dict(stats.to_dict())
+
+
+class SessionStore:
+
+    def __init__(self):
+        self.local = LRUCache(settings.SESSION_STORE_SIZE, ttl=settings.SESSION_TTL_SECONDS)
+        self.shared = RedisTier("shikshadisha:session:", ttl=settings.SESSION_TTL_SECONDS) if settings.SESSION_STORE_REDIS else None
+        self._lock = threading.Lock()
+        self.appended = 0
+
+    def get(self, user_id):
+        """A copy of the learner's EventStats, or None when there is no session."""
+        with self._lock:
+            stats = self._load(str(user_id))
+            return _snapshot(stats) if stats is not None else None
+
+    def _load(self, key):
+        # The stored object itself; only change it while holding the lock.
+        if self.shared is not None:
+            raw = self.shared.get(key)
+            if raw is not None:
+                return EventStats.from_dict(json.loads(raw))
+            if self.shared.available:
+                return None
+        return self.local.get(key)
+
+    def _put(self, key, stats):
+        self.local.set(key, stats)
+        if self.shared is not None:
+            self.shared.set(key, json.dumps(stats.to_dict(), default=str))
+
+    def append(self, user_id, events):
+        """
+        Add `events` to the learner's session (starting one if needed) and
+        return a copy of its stats, safe to read while other appends run.
+        """
+        key = str(user_id)
+        with self._lock:
+            stats = self._load(key) or EventStats(keep_times=False)
+            for event in events:
+                stats.add(event)
+            self._put(key, stats)
+            self.appended += len(events)
+            return _snapshot(stats)
+
+    def replace(self, user_id, stats):
+        """Start the learner's session over from the stats of a full event list."""
+        with self._lock:
+            self._put(str(user_id), _snapshot(stats))
+
+    def reset(self, user_id):
+        key = str(user_id)
+        with self._lock:
+            self.local.delete(key)
+            if self.shared is not None:
+                self.shared.delete(key)
+
+    def stats(self):
+        stats = {'local': self.local.stats(), 'appended_events': self.appended}
+        if self.shared is not None:
+            stats['redis'] = self.shared.stats()
+        return stats
+
+
+session_store = SessionStore()
@@ -0,0 +1,328 @@
+import contextlib
+import fcntl
+import hashlib
+import json
+import os
+import threading
+import numpy as np
+from .config import settings
+from .embeddings import embed_texts
+
+# One append-only log record per stored vector: the row it lives in and the
+# hash of the profile text it was computed from.
+RECORD = np.dtype([("user_id", "<i8"), ("row", "<i8"), ("hash", "S40")])
+HEADER_FILE = "store.json"
+VECTORS_FILE = "vectors.f16"
+LOG_FILE = "entries.log"
+LOCK_FILE = ".lock"
+# The log is compacted to one record per user once it holds this many
+# times as many records as there are users (and at least COMPACT_MIN_RECORDS).
+COMPACT_FACTOR = 2
+COMPACT_MIN_RECORDS = 1024
+
+
+def _text_hash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest().encode("ascii")
+
+
+class UserEmbeddingStore:
+    """
+    Profile embeddings keyed by user_id, stored as a float16 memory-mapped
+    matrix plus an append-only id map (entries.log) so every process sharing
+    the models volume sees every other's writes.
+
+    A vector is reused while the hash of the user's profile text matches;
+    a changed profile overwrites the user's row in place and appends a log
+    record that supersedes the old one, so the matrix grows with the number
+    of users.  Writers hold an exclusive flock on the store directory and
+    readers a shared one, so no reader sees a half-written vector.  When
+    superseded records dominate the log, compact() rewrites the log and the
+    matrix with only the live rows.
+
+    embed() leaves writing to a background thread (store_later), so
+    requests never wait for the file lock or an fsync.  Until a write lands
+    a repeated lookup misses and is served from the query embedding cache.
+    """
+
+    def __init__(self, name, directory=None):
+        self.name = name
+        self.directory = os.path.join(directory or settings.USER_EMBEDDINGS_DIR, name)
+        self._lock = threading.Lock()
+        self._rows = {}
+        self._hashes = {}
+        self._next_row = 0
+        self._log_offset = 0
+        self._log_inode = None
+        self._vectors = None
+        self._dim = None
+        self.hits = 0
+        self.misses = 0
+        self.compactions = 0
+        # user_id -> (text, vector) waiting for the writer thread
+        self._pending = {}
+        self._pending_cond = threading.Condition()
+        self._writer = None
+        self._writing = False
+
+    @contextlib.contextmanager
+    def _file_lock(self, shared=False):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, LOCK_FILE), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _check_header(self, dim):
+        """Start over when the embedding model or dimension changed (caller holds the file lock)."""
+        header = {"embedding_model": settings.EMBEDDING_MODEL, "dim": int(dim)}
+        try:
+            with open(self._path(HEADER_FILE)) as f:
+                current = json.load(f)
+        except (OSError, ValueError):
+            current = None
+        if current != header:
+            for name in (VECTORS_FILE, LOG_FILE):
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(self._path(name))
+            with open(self._path(HEADER_FILE), "w") as f:
+                json.dump(header, f)
+            self._reset()
+        self._dim = int(dim)
+
+    def _reset(self):
+        self._rows, self._hashes = {}, {}
+        self._next_row = self._log_offset = 0
+        self._log_inode = None
+        self._vectors = None
+
+    def _refresh(self):
+        """Apply log records written (by any process) since the last call."""
+        try:
+            st = os.stat(self._path(LOG_FILE))
+        except FileNotFoundError:
+            if self._log_offset:
+                self._reset()
+            return
+        size = st.st_size
+        if size < self._log_offset or (self._log_inode is not None and st.st_ino != self._log_inode):
+            # The store was reset or compacted by another process.
+            self._reset()
+        self._log_inode = st.st_ino
+        usable = size - (size - self._log_offset) % RECORD.itemsize
+        if usable <= self._log_offset:
+            return
+        with open(self._path(LOG_FILE), "rb") as f:
+            f.seek(self._log_offset)
+            records = np.frombuffer(f.read(usable - self._log_offset), dtype=RECORD)
+        for user_id, row, digest in records.tolist():
+            self._rows[user_id] = row
+            self._hashes[user_id] = digest
+            self._next_row = max(self._next_row, row + 1)
+        self._log_offset = usable
+
+    def _matrix(self, rows_needed):
+        """Read-only memmap covering at least `rows_needed` rows."""
+        if self._vectors is None or self._vectors.shape[0] < rows_needed:
+            path = self._path(VECTORS_FILE)
+            rows = os.path.getsize(path) // (2 * self._dim) if os.path.exists(path) else 0
+            self._vectors = np.memmap(path, dtype=np.float16, mode="r", shape=(rows, self._dim)) if rows else None
+        return self._vectors
+
+    def _header_dim(self):
+        if self._dim is None:
+            try:
+                with open(self._path(HEADER_FILE)) as f:
+                    header = json.load(f)
+                if header.get("embedding_model") == settings.EMBEDDING_MODEL:
+                    self._dim = header["dim"]
+            except (OSError, ValueError, KeyError):
+                pass
+        return self._dim
+
+    def lookup(self, user_ids, texts):
+        """{position: float32 vector} for users whose stored vector matches their text."""
+        found = {}
+        with self._lock:
+            if self._header_dim() is None:
+                return found
+            with self._file_lock(shared=True):
+                self._refresh()
+                wanted = [(i, self._rows[u]) for i, (u, t) in enumerate(zip(user_ids, texts))
+                          if self._hashes.get(u) == _text_hash(t)]
+                if wanted:
+                    matrix = self._matrix(max(row for _, row in wanted) + 1)
+                    for i, row in wanted:
+                        if matrix is not None and row < matrix.shape[0]:
+                            found[i] = np.asarray(matrix[row], dtype=np.float32)
+        return found
+
+    def store(self, user_ids, texts, vectors):
+        """Persist vectors for these users (last one wins for repeated ids)."""
+        if not len(user_ids):
+            return
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._lock, self._file_lock():
+            self._check_header(vectors.shape[1])
+            self._refresh()
+            latest = {u: (t, v) for u, t, v in zip(user_ids, texts, vectors)}
+            end = self._next_row
+            rows = {}
+            for u in latest:
+                if u in self._rows:
+                    rows[u] = self._rows[u]
+                else:
+                    rows[u] = end
+                    end += 1
+            row_bytes = 2 * self._dim
+            with open(self._path(VECTORS_FILE), "ab") as f:
+                # Rows past the current end (left by a crashed writer) are reused.
+                f.truncate(self._next_row * row_bytes)
+            with open(self._path(VECTORS_FILE), "r+b") as f:
+                for u, (_, v) in sorted(latest.items(), key=lambda item: rows[item[0]]):
+                    f.seek(rows[u] * row_bytes)
+                    f.write(v.astype(np.float16).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            records = np.array([(u, rows[u], _text_hash(t)) for u, (t, _) in latest.items()], dtype=RECORD)
+            with open(self._path(LOG_FILE), "ab") as f:
+                f.write(records.tobytes())
+            self._refresh()
+            if self._log_offset // RECORD.itemsize >= COMPACT_FACTOR * max(len(self._rows), COMPACT_MIN_RECORDS):
+                self._compact()
+
+    def compact(self):
+        """Rewrite the log and matrix with one record and row per user."""
+        with self._lock, self._file_lock():
+            if self._header_dim() is None:
+                return
+            self._refresh()
+            self._compact()
+
+    def _compact(self):
+        # Caller holds both locks.  Readers notice the new log's inode and reload.
+        users = sorted(self._rows)
+        live = [self._rows[u] for u in users]
+        matrix = self._matrix(max(live) + 1) if live else None
+        staging = {name: self._path(f".{name}.tmp") for name in (VECTORS_FILE, LOG_FILE)}
+        with open(staging[VECTORS_FILE], "wb") as f:
+            if live:
+                f.write(np.asarray(matrix[live], dtype=np.float16).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        records = np.array([(u, row, self._hashes[u]) for row, u in enumerate(users)], dtype=RECORD)
+        with open(staging[LOG_FILE], "wb") as f:
+            f.write(records.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(staging[VECTORS_FILE], self._path(VECTORS_FILE))
+        os.replace(staging[LOG_FILE], self._path(LOG_FILE))
+        self._reset()
+        self._refresh()
+        self.compactions += 1
+
+    def embed(self, user_ids, texts):
+        """
+        Embeddings for `texts`; rows with a user_id come from the store when
+        that user's text is unchanged, everything else is embedded (through
+        the query embedding cache) and written back.
+        """
+        texts = list(texts)
+        known = [i for i, u in enumerate(user_ids) if u is not None]
+        found = self.lookup([user_ids[i] for i in known], [texts[i] for i in known]) if known else {}
+        found = {known[i]: vec for i, vec in found.items()}
+        self.hits += len(found)
+        self.misses += len(known) - len(found)
+
+        missing = [i for i in range(len(texts)) if i not in found]
+        if not missing:
+            return self._normalized(np.stack([found[i] for i in range(len(texts))]))
+        fresh = embed_texts([texts[i] for i in missing])
+        result = np.empty((len(texts), fresh.shape[1]), dtype=np.float32)
+        for i, vec in found.items():
+            result[i] = vec
+        result[missing] = fresh
+
+        new = [(user_ids[i], texts[i], result[i]) for i in missing if user_ids[i] is not None]
+        if new:
+            self.store_later(*zip(*new))
+        if found:
+            rows = list(found)
+            result[rows] = self._normalized(result[rows])
+        return result
+
+    def store_later(self, user_ids, texts, vectors):
+        """Queue vectors for store() on the writer thread (last one wins per user)."""
+        self._ensure_writer()
+        with self._pending_cond:
+            for u, t, v in zip(user_ids, texts, vectors):
+                self._pending[u] = (t, np.array(v, dtype=np.float32))
+            self._pending_cond.notify()
+
+    def flush(self, timeout=None):
+        """Wait until queued vectors are written; False on timeout."""
+        with self._pending_cond:
+            return self._pending_cond.wait_for(lambda: not self._pending and not self._writing, timeout)
+
+    def _ensure_writer(self):
+        # Started lazily so each forked uvicorn worker gets its own thread.
+        if self._writer is None or not self._writer.is_alive():
+            with self._pending_cond:
+                if self._writer is None or not self._writer.is_alive():
+                    self._writer = threading.Thread(target=self._write_pending, name=f"user-embeddings-{self.name}", daemon=True)
+                    self._writer.start()
+
+    def _write_pending(self):
+        while True:
+            with self._pending_cond:
+                self._pending_cond.wait_for(lambda: self._pending)
+                batch, self._pending = self._pending, {}
+                self._writing = True
+            try:
+                self.store(list(batch), [t for t, _ in batch.values()], np.stack([v for _, v in batch.values()]))
+            except Exception as e:
+                print(f"Warning: failed to store user embeddings ({self.name}): {e}")
+            finally:
+                with self._pending_cond:
+                    self._writing = False
+                    self._pending_cond.notify_all()
+
+    @staticmethod
+    def _normalized(vectors):
+        # float16 storage loses a little precision; keep vectors unit length.
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'users': len(self._rows),
+            'rows': self._next_row,
+            'compactions': self.compactions,
+            'pending_writes': len(self._pending),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+# Separate stores because /match and the learner matcher build different
+# profile sentences for the same user.
+stores = {name: UserEmbeddingStore(name) for name in ("match", "learner")}
+
+
+def flush_stores(timeout=None):
+    """Write every store's queued vectors, e.g. before a batch job exits."""
+    for store in stores.values():
+        store.flush(timeout)
+
+
+def embed_profiles(name, user_ids, texts):
+    """Embeddings for profile `texts`, reusing stored vectors for known integer user_ids."""
+    if not settings.USER_EMBEDDINGS_ENABLED:
+        return embed_texts(list(texts))
+    user_ids = [u if isinstance(u, int) and not isinstance(u, bool) else None for u in user_ids]
+    return stores[name].embed(user_ids, texts)
@@ -0,0 +1,129 @@
+"""
+Recall vs latency benchmark for the FAISS index types selectable with INDEX_TYPE.
+
+Builds every index type over a synthetic, clustered catalog of unit vectors
+and reports recall@k against the exact flat baseline, single-query p50/p99
+latency, serialized index size and the share of memory saved compared with
+flat (float32) storage.
+
+    python -m benchmarks.index_benchmark --sizes 10000,100000 --dim 384
+    python -m benchmarks.index_benchmark --sizes 1000000 --types ivf_pq,hnsw
+    python -m benchmarks.index_benchmark --sizes 100000 --types sq8,sqfp16,ivf_sq8
+"""
+import argparse
+import time
+import numpy as np
+import faiss
+from app.config import settings
+from app.index_factory import INDEX_TYPES, index_config, make_index
+
+
+def synthetic_catalog(n, centres, rng):
+    # Course embeddings cluster by sector, so sample around shared centres.
+    vectors = np.empty((n, centres.shape[1]), dtype=np.float32)
+    for start in range(0, n, 100_000):
+        stop = min(start + 100_000, n)
+        labels = rng.integers(0, len(centres), stop - start)
+        vectors[start:stop] = centres[labels] + 0.6 * rng.standard_normal((stop - start, centres.shape[1]), dtype=np.float32)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def timed_search(index, queries, k):
+    latencies = np.empty(len(queries))
+    labels = np.empty((len(queries), k), dtype=np.int64)
+    for i in range(len(queries)):
+        start = time.perf_counter()
+        _, found = index.search(queries[i:i + 1], k)
+        latencies[i] = (time.perf_counter() - start) * 1000
+        labels[i] = found[0]
+    return labels, latencies
+
+
+def recall_at_k(found, truth):
+    hits = sum(len(np.intersect1d(f[f >= 0], t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def run(size, args, base_config):
+    rng = np.random.default_rng(args.seed)
+    centres = rng.standard_normal((args.clusters, args.dim)).astype(np.float32)
+    vectors = synthetic_catalog(size, centres, rng)
+    queries = synthetic_catalog(args.queries, centres, rng)
+    ids = np.arange(size, dtype=np.int64)
+    train = vectors[rng.choice(size, min(size, args.train_size), replace=False)]
+
+    rows = []
+    truth = None
+    flat_mb = None
+    for kind in ["flat"] + [t for t in args.types if t != "flat"]:
+        config = dict(base_config, type=kind)
+        faiss.omp_set_num_threads(args.build_threads)
+        start = time.perf_counter()
+        index, effective = make_index(args.dim, train, config, n_total=size)
+        index.add_with_ids(vectors, ids)
+        build_s = time.perf_counter() - start
+
+        faiss.omp_set_num_threads(args.threads)
+        found, latencies = timed_search(index, queries, args.k)
+        memory_mb = faiss.serialize_index(index).nbytes / 2 ** 20
+        if truth is None:
+            truth, flat_mb = found, memory_mb
+        rows.append({
+            "type": effective["type"],
+            "params": _describe(effective),
+            "recall": recall_at_k(found, truth),
+            "p50_ms": float(np.percentile(latencies, 50)),
+            "p99_ms": float(np.percentile(latencies, 99)),
+            "memory_mb": memory_mb,
+            "saved": 1 - memory_mb / flat_mb,
+            "build_s": build_s,
+        })
+        del index
+    return rows
+
+
+def _describe(config):
+    kind = config["type"]
+    if kind == "ivf_flat":
+        return f"nlist={config['nlist']} nprobe={config['nprobe']}"
+    if kind == "ivf_pq":
+        return f"nlist={config['nlist']} nprobe={config['nprobe']} pq={config['pq_m']}x{config['pq_nbits']}"
+    if kind == "hnsw":
+        return f"M={config['hnsw_m']} efC={config['ef_construction']} efS={config['ef_search']}"
+    if kind == "ivf_sq8":
+        return f"nlist={config['nlist']} nprobe={config['nprobe']} 8-bit codes"
+    if kind == "sq8":
+        return "8-bit codes"
+    if kind == "sqfp16":
+        return "float16 codes"
+    return "-"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,100000", help="comma separated catalog sizes (10k-1M)")
+    parser.add_argument("--types", default=",".join(INDEX_TYPES), help="index types to compare against flat")
+    parser.add_argument("--dim", type=int, default=384, help="embedding dimension (all-MiniLM-L6-v2 is 384)")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--train-size", type=int, default=100_000, help="max vectors used to train IVF/PQ")
+    parser.add_argument("--threads", type=int, default=1, help="OpenMP threads used by FAISS while querying")
+    parser.add_argument("--build-threads", type=int, default=faiss.omp_get_max_threads(), help="OpenMP threads used for training/adding")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    args.types = [t.strip() for t in args.types.split(",") if t.strip()]
+
+    # Tuning parameters come from the same settings the service uses.
+    base_config = index_config(settings)
+
+    print(f"{'courses':>9} {'type':<9} {'params':<38} {'recall@' + str(args.k):>9} {'p50 ms':>8} {'p99 ms':>8} {'MB':>9} {'saved':>6} {'build s':>8}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        for row in run(size, args, base_config):
+            print(f"{size:>9} {row['type']:<9} {row['params']:<38} {row['recall']:>9.3f} {row['p50_ms']:>8.3f} "
+                  f"{row['p99_ms']:>8.3f} {row['memory_mb']:>9.1f} {row['saved']:>6.0%} {row['build_s']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()